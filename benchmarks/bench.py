@@ -0,0 +1,169 @@
+"""
+Time the hot paths of the game, agents, solver and value fn I/O.
+
+    python benchmarks/bench.py                  # time everything, compare against baseline.json
+    python benchmarks/bench.py --save-baseline  # time everything, and make the results the new baseline
+    python benchmarks/bench.py -k Board         # only benchmarks with "Board" in their name
+
+Results (seconds per call) are written to results.json next to this file.
+Anything slower than the baseline by more than --threshold is reported as a regression, and the exit status is 1.
+Timings only compare meaningfully against a baseline made on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+sys.path.insert(0, SRC)
+
+import numpy as np
+import reference
+from Agent import EpsilonAgent, TDAgent, MCAgent, play_match
+from TicTacToe import Board
+from ValueStore import ArrayValue
+from BatchPlay import play_matches, afterstates, REWARDS
+from RandomStream import RandomStream
+import DPSolver
+
+
+def benchmarks(tmp_dir):
+    """
+    :param tmp_dir: directory for benchmarks which write files
+    :return: list of (name, function to time, number of calls per timing)
+    """
+    # a mid-game position, and a symmetric copy of it
+    board = Board()
+    for move, player in [(5, 1), (1, 2), (9, 1)]:
+        board.play_move(move, player)
+    mirrored = Board(np.fliplr(board.board))
+    ref_board = reference.Board(board.board)
+
+    optimal = DPSolver.optimal_value_fn()
+    optimal_dict = dict(optimal.items())
+    dict_agent = EpsilonAgent(2, epsilon=0, value=optimal_dict)
+    dict_agent.game = board
+    array_agent = EpsilonAgent(2, epsilon=0, value=optimal)
+    array_agent.game = board
+
+    p1 = EpsilonAgent(1, rng=0).load_value(os.path.join(SRC, "TDValueX.json"))
+    p2 = EpsilonAgent(2, rng=1).load_value(os.path.join(SRC, "TDValueO.json"))
+
+    # recorded games for the training benchmarks
+    rewards = {0: 0, 1: 1, 2: -1}
+    games = [play_match(p1, p2, startermove=[1, 2, 5][i % 3]) for i in range(100)]
+    td = TDAgent(1, value=dict(p1.value))
+    mc = MCAgent(1, value=dict(p1.value))
+
+    def train(agent):
+        for outcome, game_log in games:
+            agent.train(game_log[::2], rewards[outcome])
+
+    # a batch of 1000 recorded games for train_batch
+    batch_p1 = EpsilonAgent(1, value=ArrayValue() | p1.value)
+    batch_p2 = EpsilonAgent(2, value=ArrayValue() | p2.value)
+    status, log, lengths = play_matches(batch_p1, batch_p2, 1000, rng=np.random.default_rng(0))
+    batch = afterstates(log, lengths, 1) + (REWARDS[status],)
+    td_batch = TDAgent(1, value=ArrayValue() | p1.value)
+    mc_batch = MCAgent(1, value=ArrayValue() | p1.value)
+
+    stream = RandomStream(0)
+
+    json_path = os.path.join(tmp_dir, "value.json")
+    binary_path = os.path.join(tmp_dir, "value.ttv")
+    optimal.copy()  # warm up
+    EpsilonAgent(1, value=optimal).save_value(json_path)
+    EpsilonAgent(1, value=optimal).save_value(binary_path)
+
+    return [
+        ("Board.play_move", lambda: board.copy().play_move(3, 2), 100_000),
+        ("Board.running_state", board.running_state, 100_000),
+        ("Board.get_legals", board.get_legals, 100_000),
+        ("Board.__hash__", lambda: hash(board), 100_000),
+        ("Board.__eq__", lambda: board == mirrored, 100_000),
+        ("reference.Board.play_move", lambda: ref_board.copy().play_move(3, 2), 2_000),
+        ("reference.Board.__hash__", lambda: hash(ref_board), 2_000),
+        ("EpsilonAgent.get_best_move[dict]", dict_agent.get_best_move, 10_000),
+        ("EpsilonAgent.get_best_move[ArrayValue]", array_agent.get_best_move, 10_000),
+        ("play_match", lambda: play_match(p1, p2), 1_000),
+        ("RandomStream.random", stream.random, 1_000_000),
+        ("TDAgent.train[100 games]", lambda: train(td), 20),
+        ("MCAgent.train[100 games]", lambda: train(mc), 20),
+        ("TDAgent.train_batch[1000 games]", lambda: td_batch.train_batch(*batch), 20),
+        ("MCAgent.train_batch[1000 games]", lambda: mc_batch.train_batch(*batch), 20),
+        ("DPSolver.optimal_value_fn[uncached]", lambda: DPSolver.optimal_value_fn(cache_dir=None), 5),
+        ("save_value[json]", lambda: EpsilonAgent(1, value=optimal).save_value(json_path), 20),
+        ("load_value[json]", lambda: EpsilonAgent(1).load_value(json_path), 20),
+        ("save_value[binary]", lambda: EpsilonAgent(1, value=optimal).save_value(binary_path), 100),
+        ("load_value[binary]", lambda: EpsilonAgent(1, value=ArrayValue()).load_value(binary_path), 100),
+    ]
+
+
+def run(pattern=None, repeat=5):
+    """
+    :return: {benchmark name: best seconds per call}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, fn, number in benchmarks(tmp_dir):
+            if pattern is not None and pattern not in name:
+                continue
+            seconds = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+            results[name] = seconds
+            print(f"{name:42s} {seconds * 1e6:12.2f} us")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: list of (name, slowdown) for benchmarks slower than baseline by more than threshold
+    """
+    regressions = []
+    for name, seconds in results.items():
+        if name in baseline:
+            slowdown = seconds / baseline[name]
+            if slowdown > 1 + threshold:
+                regressions.append((name, slowdown))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the hot paths and compare against a stored baseline")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    parser.add_argument("--output", default=os.path.join(HERE, "results.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file")
+    args = parser.parse_args()
+
+    results = run(args.pattern)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seconds_per_call": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to make one")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)["seconds_per_call"]
+    regressions = compare(results, baseline, args.threshold)
+    for name, slowdown in regressions:
+        print(f"REGRESSION: {name} is {slowdown:.2f}x slower than baseline")
+    if not regressions:
+        print(f"no regressions (threshold {args.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,105 @@
+"""
+Check that the fast implementations agree with the original numpy code (reference.py) over the whole state space:
+game statuses, legal moves, canonical hashes, greedy moves and solved values.
+
+Run from anywhere: python benchmarks/differential.py
+Exits with status 1 if anything disagrees.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import reference
+from Agent import EpsilonAgent
+from MNKBoard import MNKBoard
+from StateSpace import get_state_space
+from TicTacToe import Board, GameStatus, STATUS
+import DPSolver
+
+
+def check_boards(boards):
+    """
+    statuses, legal moves and string round trips of every reachable position, and of every move from it
+    """
+    errors = []
+    for ref in boards:
+        board = Board(ref.board)
+        mnk = MNKBoard.from_string(str(ref))
+        status = ref.running_state()
+        legals = [int(move) for move in ref.get_legals()]
+        if not (board.running_state() == mnk.running_state() == STATUS[board.code] == status):
+            errors.append(f"status differs for\n{ref}")
+        if not (list(board.get_legals()) == mnk.get_legals() == legals):
+            errors.append(f"legal moves differ for\n{ref}")
+        if str(board) != str(ref) or str(Board.from_string(str(ref))) != str(ref) or len(board) != len(ref):
+            errors.append(f"string/len differs for\n{ref}")
+        if status == GameStatus.RUNNING:
+            player = 1 if len(ref) % 2 == 0 else 2
+            for move in legals:
+                if board.copy().play_move(move, player) != ref.sim_move(move, player).running_state():
+                    errors.append(f"status after move {move} differs for\n{ref}")
+    return errors
+
+
+def check_hashes(boards):
+    """
+    boards must be grouped into the same symmetry classes as the reference __hash__/__eq__
+    """
+    errors = []
+    classes = {}  # reference canonical key -> set of canonical ids
+    for ref in boards:
+        key = min(reference.Board.to_digits(b) for b in ref.equivs())
+        classes.setdefault(key, set()).add(Board(ref.board).canonical_id())
+    if any(len(ids) != 1 for ids in classes.values()):
+        errors.append("some reference symmetry class has several canonical ids")
+    if len(set.union(*classes.values())) != len(classes):
+        errors.append("some canonical id covers several reference symmetry classes")
+    space = get_state_space()
+    if len(space) != len(classes):
+        errors.append(f"StateSpace has {len(space)} positions, expected {len(classes)}")
+    return errors
+
+
+def check_values():
+    """
+    solved values must match the reference solver, and greedy moves must match between value stores
+    """
+    errors = []
+    expected = reference.optimal_value_fn()
+    solved = DPSolver.optimal_value_fn(cache_dir=None)
+    if len(solved) != len(expected):
+        errors.append(f"solver found {len(solved)} states, expected {len(expected)}")
+    for ref, value in expected.items():
+        if abs(solved[Board(ref.board)] - value) > 1e-12:
+            errors.append(f"solved value {solved[Board(ref.board)]} != {value} for\n{ref}")
+
+    as_dict = dict(solved.items())
+    for ref in reference.reachable_boards():
+        if ref.running_state() != GameStatus.RUNNING:
+            continue
+        player = 1 if len(ref) % 2 == 0 else 2
+        moves = []
+        for value in (as_dict, solved):
+            agent = EpsilonAgent(player, epsilon=0, value=value)
+            agent.game = Board(ref.board)
+            moves.append(int(agent.get_best_move()))
+        if moves[0] != moves[1]:
+            errors.append(f"greedy moves {moves} differ between dict and ArrayValue for\n{ref}")
+    return errors
+
+
+if __name__ == "__main__":
+    boards = reference.reachable_boards()
+    print(f"{len(boards)} reachable positions")
+    failed = False
+    for name, errors in [
+        ("statuses and legal moves", check_boards(boards)),
+        ("canonical hashes", check_hashes(boards)),
+        ("solved values and greedy moves", check_values()),
+    ]:
+        print(f"{name}: {'ok' if not errors else f'{len(errors)} mismatches'}")
+        for error in errors[:5]:
+            print(error)
+        failed |= bool(errors)
+    sys.exit(1 if failed else 0)
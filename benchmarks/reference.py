@@ -0,0 +1,158 @@
+"""
+The original numpy implementations of Board and the DP solver, kept as a reference for differential.py.
+Not used by anything else: this is what the faster code has to agree with.
+"""
+import numpy as np
+
+
+class GameStatus:
+    DRAW = 0
+    P1_WIN = 1
+    P2_WIN = 2
+    RUNNING = 3
+
+
+def idx_to_coords(pos):
+    row = (10 - pos - 1) // 3
+    col = (pos - 1) % 3
+    return row, col
+
+
+class Board:
+    def __init__(self, board=np.zeros([3, 3], dtype=int)):
+        self.board = board.copy()
+
+    @staticmethod
+    def to_digits(board):
+        acc = 0
+        for row in board:
+            for x in row:
+                acc = acc << 2
+                acc += x
+        return acc
+
+    def play_move(self, pos, player):
+        row, col = idx_to_coords(pos)
+        self.board[row][col] = player
+        return self.running_state()
+
+    def sim_move(self, pos, player):
+        sim_board = self.copy()
+        sim_board.play_move(pos, player)
+        return sim_board
+
+    def running_state(self):
+        for i in range(3):
+            row = self.board[i, :]
+            col = self.board[:, i]
+            for ax in [row, col]:
+                if ax[0] != 0 and np.all(ax == ax[0]):
+                    return ax[0]
+
+        d1 = self.board[[0, 1, 2], [0, 1, 2]]
+        d2 = self.board[[0, 1, 2], [2, 1, 0]]
+        for ax in [d1, d2]:
+            if ax[0] != 0 and np.all(ax == ax[0]):
+                return ax[0]
+
+        if len(self.get_legals()) == 0:
+            return GameStatus.DRAW
+        return GameStatus.RUNNING
+
+    def equivs(self):
+        r0 = self.board
+        r1 = np.rot90(r0)
+        r2 = np.rot90(r1)
+        r3 = np.rot90(r2)
+        href = np.fliplr(self.board)
+        vref = np.flipud(self.board)
+        diag = self.board.T
+        diag2 = self.board[::-1, ::-1].T
+        return [r0, r1, r2, r3, vref, href, diag, diag2]
+
+    def get_legals(self):
+        return np.nonzero(self.get_flat() == 0)[0] + 1
+
+    def get_flat(self):
+        return (np.flipud(self.board)).reshape(9)
+
+    def copy(self):
+        return Board(self.board)
+
+    def __repr__(self):
+        XO = [" ", "X", "O"]
+        a = [XO[x] for x in np.nditer(self.board)]
+        return (
+            f"{a[0]} | {a[1]} | {a[2]}\n"
+            f"{'-' * 9}\n"
+            f"{a[3]} | {a[4]} | {a[5]}\n"
+            f"{'-' * 9}\n"
+            f"{a[6]} | {a[7]} | {a[8]}"
+        )
+
+    def __hash__(self):
+        return hash(min([self.to_digits(b) for b in self.equivs()]))
+
+    def __eq__(self, other):
+        for a in self.equivs():
+            if self.to_digits(a) == self.to_digits(other.board):
+                return True
+        return False
+
+    def __len__(self):
+        return np.count_nonzero(self.board)
+
+
+def reward(outcome):
+    return {GameStatus.DRAW: 0, GameStatus.P1_WIN: 1, GameStatus.P2_WIN: -1}[outcome]
+
+
+def optimal_value_fn():
+    player = 1
+    states = []
+    b = Board()
+    states.append({b: [b.sim_move(move, player) for move in b.get_legals()]})
+    for i in range(1, 10):
+        states.append({})
+        player = (i % 2) + 1
+        for s, afterstates in states[i - 1].items():
+            if not afterstates:
+                continue
+            for a in afterstates:
+                if a.running_state() == GameStatus.RUNNING:
+                    states[i][a] = [a.sim_move(move, player) for move in a.get_legals()]
+                else:
+                    states[i][a] = []
+
+    value = {}
+    for i in range(9, -1, -1):
+        player = (i % 2) + 1
+        for state in states[i]:
+            if not states[i][state]:
+                value[state] = reward(state.running_state())
+            else:
+                minmax = max if player == 1 else min
+                value[state] = 0.9 * minmax([value[afterstate] for afterstate in states[i][state]])
+    return value
+
+
+def reachable_boards():
+    """
+    every position that can come up in a game (not deduplicated by symmetry), in order of plies played
+    """
+    seen = set()
+    boards = []
+    frontier = [Board()]
+    while frontier:
+        next_frontier = []
+        for board in frontier:
+            key = Board.to_digits(board.board)
+            if key in seen:
+                continue
+            seen.add(key)
+            boards.append(board)
+            if board.running_state() == GameStatus.RUNNING:
+                player = 1 if len(board) % 2 == 0 else 2
+                next_frontier += [board.sim_move(move, player) for move in board.get_legals()]
+        frontier = next_frontier
+    return boards
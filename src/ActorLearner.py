@@ -0,0 +1,168 @@
+"""
+Train a pair of agents with several processes.
+Actor processes play games against snapshots of the learner's value functions, and stream the games back to the
+learner (the calling process), which trains the agents and periodically publishes new snapshots.
+"""
+from Agent import EpsilonAgent, play_match
+from RandomStream import RandomStream
+from TicTacToe import Board, GameStatus, N_CODES
+from ValueStore import ArrayValue
+import multiprocessing as mp
+import numpy as np
+import os
+import queue
+import time
+
+REWARDS = {
+    GameStatus.DRAW: 0,
+    GameStatus.P1_WIN: 1,
+    GameStatus.P2_WIN: -1
+}
+
+
+class Snapshot:
+    """
+    Copy of both value functions in shared memory, with a version number so actors know when to refresh
+    """
+    def __init__(self, ctx):
+        self.lock = ctx.Lock()
+        self.version = ctx.RawValue("l", 0)
+        self.tables = [ctx.RawArray("d", N_CODES) for _ in range(2)]
+        self.seen = [ctx.RawArray("b", N_CODES) for _ in range(2)]
+
+    def publish(self, p1, p2):
+        """
+        copy the learner's value functions into shared memory
+        """
+        with self.lock:
+            for i, agent in enumerate((p1, p2)):
+                np.frombuffer(self.tables[i], dtype=np.float64)[:] = agent.value.table
+                np.frombuffer(self.seen[i], dtype=np.bool_)[:] = agent.value.seen
+            self.version.value += 1
+
+    def load(self, p1, p2):
+        """
+        copy the latest snapshot into an actor's value functions
+        :return: version of the snapshot that was loaded
+        """
+        with self.lock:
+            for i, agent in enumerate((p1, p2)):
+                agent.value.table[:] = np.frombuffer(self.tables[i], dtype=np.float64)
+                agent.value.seen[:] = np.frombuffer(self.seen[i], dtype=np.bool_)
+            return self.version.value
+
+
+def _actor(actor_id, snapshot, games, stop, epsilon, games_per_message, rng):
+    """
+    Play games forever (until `stop` is set), sending them to the learner in chunks of games_per_message.
+    Each game is sent as (outcome, [encoding of the board after each ply])
+    :param rng: this actor's RandomStream. its two children are used by the actor's agents
+    """
+    p1_rng, p2_rng = rng.spawn(2)
+    p1 = EpsilonAgent(1, epsilon=epsilon, value=ArrayValue(), rng=p1_rng)
+    p2 = EpsilonAgent(2, epsilon=epsilon, value=ArrayValue(), rng=p2_rng)
+    version = snapshot.load(p1, p2)
+
+    openers = [1, 2, 5]
+    played = 0
+    chunk = []
+    while not stop.is_set():
+        if snapshot.version.value != version:
+            version = snapshot.load(p1, p2)
+
+        outcome, game_log = play_match(p1, p2, startermove=openers[(actor_id + played) % 3])
+        played += 1
+        chunk.append((outcome, [board.code for board in game_log]))
+
+        if len(chunk) == games_per_message:
+            # block while the queue is full, so actors can't get too far ahead of the learner
+            while not stop.is_set():
+                try:
+                    games.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            chunk = []
+
+
+def train_parallel(p1, p2, n_games, n_actors=None, snapshot_every=1000, queue_size=64, games_per_message=16,
+                   seed=None, verbose=True):
+    """
+    Train p1 and p2 on n_games played by a pool of actor processes.
+    The calling process is the learner: it calls p1.train/p2.train on every game it receives.
+    :param p1: learning agent playing X, backed by a ValueStore.ArrayValue
+    :param p2: learning agent playing O, backed by a ValueStore.ArrayValue
+    :param n_games: number of games to train on
+    :param n_actors: number of actor processes. defaults to one per spare core
+    :param snapshot_every: publish new value functions to the actors every this many games
+    :param queue_size: max number of messages waiting for the learner. actors wait when the queue is full
+    :param games_per_message: number of games actors send at a time
+    :param seed: optional seed for the actors' random number generators. each actor gets its own child stream
+    :param verbose: print throughput every snapshot
+    :return: dict of throughput stats
+    """
+    for agent in (p1, p2):
+        if not isinstance(agent.value, ArrayValue):
+            raise TypeError("train_parallel needs agents whose value is a ValueStore.ArrayValue")
+    if n_actors is None:
+        n_actors = max(1, (os.cpu_count() or 2) - 1)
+
+    ctx = mp.get_context()
+    snapshot = Snapshot(ctx)
+    snapshot.publish(p1, p2)
+    games = ctx.Queue(maxsize=queue_size)
+    stop = ctx.Event()
+    streams = RandomStream(seed).spawn(n_actors)
+    actors = [
+        ctx.Process(
+            target=_actor,
+            args=(i, snapshot, games, stop, p1.epsilon, games_per_message, streams[i]),
+            daemon=True
+        )
+        for i in range(n_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    cores = n_actors + 1
+    games_played = 0
+    start = time.perf_counter()
+    try:
+        while games_played < n_games:
+            try:
+                chunk = games.get(timeout=1)
+            except queue.Empty:
+                if not any(actor.is_alive() for actor in actors):
+                    raise RuntimeError("all actor processes have died")
+                continue
+
+            for outcome, codes in chunk[:n_games - games_played]:
+                game_log = [Board.from_code(code) for code in codes]
+                p1.train(game_log[::2], REWARDS[outcome])
+                p2.train(game_log[1::2], REWARDS[outcome])
+                games_played += 1
+
+                if games_played % snapshot_every == 0:
+                    snapshot.publish(p1, p2)
+                    if verbose:
+                        rate = games_played / (time.perf_counter() - start)
+                        print(f"{games_played} games played, {rate:.0f} games/sec, {rate / cores:.0f} games/sec/core")
+    finally:
+        stop.set()
+        # empty the queue so no actor is stuck on a put
+        while any(actor.is_alive() for actor in actors):
+            try:
+                games.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "games": games_played,
+        "seconds": elapsed,
+        "actors": n_actors,
+        "games_per_sec": games_played / elapsed,
+        "games_per_sec_per_core": games_played / elapsed / cores,
+    }
@@ -1,25 +1,74 @@
 """
 An agent to learn and play tic tac toe via Monte Carlo Control.
 """
-from TicTacToe import Board, GameStatus
-import random
+from TicTacToe import Board, GameStatus, DIGITS, POW3, CANON_ID, STATUS
+from ValueStore import ArrayValue
+from RandomStream import RandomStream
+from NTuple import NTupleValue
+import NTuple
+import ValueFile
 import numpy as np
 import json
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
+# reward for each GameStatus, indexed by status. RUNNING gets 0
+_STATUS_REWARDS = np.array([0, 1, -1, 0])
 
-def play_match(agent1, agent2, startermove=None):
+
+class Trajectory:
+    """
+    Reusable record of a game: the code (Board.code) of the board after each ply, in a preallocated array.
+    Pass the same Trajectory to play_match every game, so recording a game doesn't allocate anything
+    """
+    def __init__(self, max_plies=9):
+        self.codes = np.zeros(max_plies, dtype=np.int32)  # code of the board after each ply
+        self.length = 0  # number of plies played
+
+    def reset(self):
+        self.length = 0
+
+    def append(self, code):
+        self.codes[self.length] = code
+        self.length += 1
+
+    def afterstates(self, player):
+        """
+        :param player: 1 for X, 2 for O
+        :return: codes of the player's afterstates, as a view which the next game will overwrite
+        """
+        return self.codes[player - 1:self.length:2]
+
+    def boards(self):
+        """
+        :return: list of Boards, like play_match's game_log
+        """
+        return [Board.from_code(code) for code in self.codes[:self.length].tolist()]
+
+    def __len__(self):
+        return self.length
+
+
+def play_match(agent1, agent2, startermove=None, board=None, trajectory=None):
     """
     Get two Agents to play against each other
     :param agent1: agent playing as X
     :param agent2: agent playing as O
     :param startermove: optional starter move (1-9)
-    :return: GameStatus: status (result of game), [Board]: game_log (list of board states seen in game)
+    :param board: optional empty board to play on, e.g. an MNKBoard. defaults to a 3x3 Board
+    :param trajectory: optional Trajectory to record the game in, instead of a list of Boards (3x3 Boards only)
+    :return: GameStatus: status (result of game), [Board]: game_log (list of board states seen in game),
+             or the Trajectory if one was passed in
     """
     # init
-    game_log = []
     player = agent1  # player who is next to move
-    board = Board()
+    board = Board() if board is None else board
+    if trajectory is None:
+        game_log = []
+    else:
+        trajectory.reset()
+        game_log = trajectory
     agent1.new_game(board)
     agent2.new_game(board)
 
@@ -28,44 +77,118 @@ def play_match(agent1, agent2, startermove=None):
         status = agent1.play_move(startermove)
     else:
         status = agent1.play_policy_move()
-    game_log.append(board.copy())
+    game_log.append(board.copy() if trajectory is None else board.code)
     player = agent2
 
     # play out match
     while status == GameStatus.RUNNING:
         status = player.play_policy_move()
-        game_log.append(board.copy())
+        game_log.append(board.copy() if trajectory is None else board.code)
         player = agent2 if (player == agent1) else agent1
 
     return status, game_log
 
 
+def _sequential_updates(value, ids, decay, b, b_reset, reset):
+    """
+    Apply v <- decay * v + b to each occurrence of a state in ids, in order, as if they were applied one at a time.
+    An occurrence marked in reset (or the first occurrence of a state the value fn hasn't seen) sets v <- b_reset instead.
+    Repeated states are handled in closed form: each occurrence's b is scaled by decay**(number of later occurrences)
+    :param value: ArrayValue to update
+    :param ids: canonical ids, in the order the updates would be applied
+    :param decay: multiplier of the old value for a normal update
+    :param b: added value for a normal update of each occurrence
+    :param b_reset: value set by a reset occurrence
+    :param reset: bool array, True where the occurrence always sets the value
+    """
+    if len(ids) == 0:
+        return
+    order = np.argsort(ids, kind="stable")  # groups occurrences of each state, keeping their order
+    ids = ids[order]
+    b, b_reset, reset = b[order], b_reset[order], reset[order]
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])  # first occurrence of each state
+    states = ids[starts]
+    counts = np.diff(np.r_[starts, len(ids)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    rank = np.arange(len(ids)) - starts[group]
+    later = counts[group] - 1 - rank
+
+    # first visit to a state which hasn't been seen sets its value
+    reset = reset.copy()
+    reset[starts[~value.seen[states]]] = True
+    b = np.where(reset, b_reset, b)
+
+    # only the last reset of a state and the updates after it count
+    last_reset = np.maximum.reduceat(np.where(reset, rank, -1), starts)
+    keep = rank >= last_reset[group]
+    total = np.add.reduceat(np.where(keep, b * decay ** later, 0), starts)
+    old = np.where(last_reset >= 0, 0, value.table[states] * decay ** counts)
+
+    value.table[states] = old + total
+    value.seen[states] = True
+
+
 class _AgentABC(ABC):
-    def __init__(self, player_id, alpha, gamma, board=None):
+    def __init__(self, player_id, alpha, gamma, board=None, value=None, rng=None):
         """
         init agent. child classes specify how to update and interpret value function
         :param player_id: 1 for X, 2 for O
         :param alpha: learning rate
         :param gamma: decay rate for future rewards
         :param board: board the agent is playing on
+        :param value: optional value store to use instead of a dict, e.g. ValueStore.ArrayValue()
+        :param rng: RandomStream for every random choice the agent makes, or a seed for a new one. None for a random seed
         """
         self.alpha = alpha
         self.gamma = gamma
         self.game = Board() if board is None else board
         # keys to self.value are Boards, values are floats.
-        self.value = {}  # lookup table for value fn. >0 means good for p1. <0 means good for p2
+        self.value = {} if value is None else value  # lookup table for value fn. >0 means good for p1. <0 means good for p2
         self.player_id = player_id  # 1 if X, 2 if O
+        self.rng = RandomStream.of(rng)
 
     def load_value(self, rpath):
         """
         Load a value function from a .json file at location rpath
+        Files with the ValueFile.EXTENSION suffix are read as binary value files instead,
+        and .npz files (NTuple.EXTENSION) as an NTupleValue, which replaces the agent's value store
         :param rpath: path to .json file
         :return: self
         """
+        if rpath.endswith(NTuple.EXTENSION):
+            self.value = NTupleValue.load(rpath)
+            return self
+        if rpath.endswith(ValueFile.EXTENSION):
+            self.value.clear()
+            ValueFile.load_value(rpath, self.value)
+            return self
 
         with open(rpath, 'r') as f:
             data = json.load(f)
-        self.value = {Board.from_string(k): v for k, v in data.items()}
+        self.value.clear()  # keep whichever value store we were given
+        for k, v in data.items():
+            self.value[Board.from_string(k)] = v
+
+        return self
+
+    def save_value(self, rpath):
+        """
+        Save the value function to a .json file at location rpath. Inverse of load_value()
+        Paths with the ValueFile.EXTENSION suffix are written as binary value files instead.
+        NTupleValues are written as .npz, with rpath's suffix swapped for NTuple.EXTENSION
+        :param rpath: path to .json file
+        :return: self
+        """
+        if isinstance(self.value, NTupleValue):
+            self.value.save(NTuple.npz_path(rpath))
+            return self
+        if rpath.endswith(ValueFile.EXTENSION):
+            ValueFile.save(rpath, self.value)
+            return self
+
+        with open(rpath, 'w') as f:
+            json.dump({str(board): val for board, val in self.value.items()}, f)
 
         return self
 
@@ -110,28 +233,288 @@ class _AgentABC(ABC):
 
 
 class TreeSearchAgent(_AgentABC):
+    """
+    Agent which picks moves with an alpha-beta search, scoring positions at the search horizon with its value fn.
+    Searched positions go in a transposition table keyed by canonical board id, so symmetric positions share entries.
+    The table is kept across moves and games, holding at most max_entries. The least recently used entry is evicted.
+    """
+    # transposition table flags: whether a stored value is exact, or only a lower/upper bound on the true value
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    REWARDS = {GameStatus.DRAW: 0, GameStatus.P1_WIN: 1, GameStatus.P2_WIN: -1}
+
+    def __init__(self, player_id, alpha=0.1, gamma=0.9, depth=3, max_entries=100_000, board=None, value=None,
+                 rng=None):
+        """
+        :param depth: number of plies to search, including our own move
+        :param max_entries: size limit of the transposition table
+        """
+        super().__init__(player_id, alpha, gamma, board=board, value=value, rng=rng)
+        self.depth = depth
+        self.max_entries = max_entries
+        self.table = OrderedDict()  # canonical id -> (depth searched, value, flag). oldest entries first
+
+        # search stats
+        self.nodes = 0  # total positions searched
+        self.tt_hits = 0  # positions answered by the transposition table
+        self.move_nodes = []  # positions searched for each move
+        self.move_times = []  # seconds spent on each move
+
+    def _children(self, board, player):
+        """
+        All moves from board, ordered best first according to the value fn
+        :return: list of (move, afterstate, GameStatus of afterstate)
+        """
+        children = []
+        for move in board.get_legals():
+            child = board.copy()
+            status = child.play_move(move, player)
+            children.append((move, child, status))
+
+        def guess(c):
+            return self.REWARDS[c[2]] if c[2] != GameStatus.RUNNING else self.value.get(c[1], 0)
+        children.sort(key=guess, reverse=(player == 1))
+        return children
+
+    def _child_window(self, lo, hi):
+        """
+        values are decayed by gamma each ply, so scale the window to match the children's values.
+        with gamma=0 every child is worth 0 whatever it scores, so children are searched with the full window
+        :return: (lo, hi) window to search children with
+        """
+        if self.gamma == 0:
+            return -np.inf, np.inf
+        return lo / self.gamma, hi / self.gamma
+
+    def _alphabeta(self, board, status, player, depth, lo, hi):
+        """
+        Value of board, searched `depth` plies deep.
+        Values are exact when they land strictly between lo and hi, otherwise they're only a bound
+        :param status: GameStatus of board
+        :param player: player to move on board
+        """
+        self.nodes += 1
+        if status != GameStatus.RUNNING:
+            return self.REWARDS[status]
+        if depth == 0:
+            return self.value.get(board, 0)
+
+        key = board.canonical_id()
+        entry = self.table.get(key)
+        if entry is not None:
+            self.table.move_to_end(key)
+            entry_depth, value, flag = entry
+            if entry_depth >= depth:
+                self.tt_hits += 1
+                if flag == self.EXACT:
+                    return value
+                elif flag == self.LOWER:
+                    lo = max(lo, value)
+                else:
+                    hi = min(hi, value)
+                if lo >= hi:
+                    return value
+
+        window = lo, hi
+        best = -np.inf if player == 1 else np.inf
+        for move, child, child_status in self._children(board, player):
+            value = self.gamma * self._alphabeta(child, child_status, 3 - player, depth - 1,
+                                                 *self._child_window(lo, hi))
+            if player == 1:
+                best = max(best, value)
+                lo = max(lo, value)
+            else:
+                best = min(best, value)
+                hi = min(hi, value)
+            if lo >= hi:
+                break
+
+        flag = self.UPPER if best <= window[0] else self.LOWER if best >= window[1] else self.EXACT
+        self.table[key] = (depth, best, flag)
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+        return best
 
     def search(self):
         """
-        3-ply minimax search
+        Alpha-beta search, self.depth plies deep (3-ply by default)
+        :return: (best move (1-9), value of the move)
+        """
+        start, start_nodes = time.perf_counter(), self.nodes
+        lo, hi = -np.inf, np.inf
+        best_move, best_value = None, None
+        for move, child, status in self._children(self.game, self.player_id):
+            value = self.gamma * self._alphabeta(child, status, 3 - self.player_id, self.depth - 1,
+                                                 *self._child_window(lo, hi))
+            if self.player_id == 1 and (best_value is None or value > best_value):
+                best_move, best_value = move, value
+                lo = value
+            elif self.player_id == 2 and (best_value is None or value < best_value):
+                best_move, best_value = move, value
+                hi = value
+
+        self.move_nodes.append(self.nodes - start_nodes)
+        self.move_times.append(time.perf_counter() - start)
+        return best_move, best_value
+
+    def search_stats(self):
         """
-        raise NotImplementedError
+        :return: dict of search cost so far
+        """
+        moves = len(self.move_times)
+        return {
+            "moves": moves,
+            "nodes": self.nodes,
+            "nodes_per_move": self.nodes / moves if moves else 0,
+            "seconds_per_move": sum(self.move_times) / moves if moves else 0,
+            "tt_entries": len(self.table),
+            "tt_hits": self.tt_hits,
+        }
 
     def get_best_move(self):
-        raise NotImplementedError
+        return self.search()[0]
 
     def play_policy_move(self):
-        raise NotImplementedError
+        return self.play_move(self.get_best_move())
 
     def get_value(self, board):
-        raise NotImplementedError
+        return self.value[board]
 
     def train(self, afterstates, reward):
-        raise NotImplementedError
+        raise NotImplementedError("base class TreeSearchAgent doesn't know how to train()")
 
 
 class TDLeafAgent(TreeSearchAgent):
-    pass
+    """
+    An agent that learns w/ TD-Leaf(lambda) and epsilon-greedy policy.
+    Moves are chosen with a full-width search, and training updates the leaf at the end of each move's
+    principal variation instead of the afterstate of the move.
+    The search tree is built a ply at a time as arrays of board encodings, so every leaf is valued in one lookup.
+    This needs the value fn to be a ValueStore.ArrayValue.
+    """
+    def __init__(self, player_id, alpha=0.1, gamma=0.9, lambda_=0.7, epsilon=0.1, depth=2, board=None, value=None,
+                 rng=None):
+        """
+        :param lambda_: decay rate of the eligibility of earlier leaves
+        :param epsilon: chance of playing a random move
+        :param depth: number of plies to search, including our own move
+        """
+        value = ArrayValue() if value is None else value
+        if not isinstance(value, ArrayValue):
+            raise TypeError("TDLeafAgent needs its value to be a ValueStore.ArrayValue")
+        super().__init__(player_id, alpha, gamma, depth=depth, board=board, value=value, rng=rng)
+        self.lambda_ = lambda_
+        self.epsilon = epsilon
+        self.leaves = []  # canonical id of the principal variation leaf of each of our moves this game
+        self.leaf_count = 0  # total leaves valued by searches
+
+    def new_game(self, board=None):
+        super().new_game(board)
+        self.leaves = []
+
+    def search(self):
+        """
+        Full-width minimax search, self.depth plies deep
+        :return: (best move (1-9), value of the move)
+        """
+        start = time.perf_counter()
+
+        # build the tree one ply at a time, as the encodings of every node plus the index of each node's parent
+        codes, parents, squares = [np.array([self.game.code])], [None], [None]
+        player = self.player_id
+        for _ in range(self.depth):
+            playable = (DIGITS[codes[-1]] == 0) & (STATUS[codes[-1]] == GameStatus.RUNNING)[:, None]
+            parent, square = np.nonzero(playable)
+            if len(parent) == 0:
+                break
+            codes.append(codes[-1][parent] + player * POW3[square])
+            parents.append(parent)
+            squares.append(square)
+            player = 3 - player
+        depth = len(codes) - 1
+
+        # value every leaf at once: terminal leaves get their reward, the rest come from the value fn
+        status = STATUS[codes[-1]]
+        values = np.where(status == GameStatus.RUNNING, self.value.table[CANON_ID[codes[-1]]], _STATUS_REWARDS[status])
+        self.leaf_count += len(codes[-1])
+        nodes = sum(len(level) for level in codes)
+        self.nodes += nodes
+
+        # back values up to the root, remembering the best child of every node (first one, if there's a tie)
+        best_children = [None] * depth
+        for k in range(depth - 1, -1, -1):
+            player = self.player_id if k % 2 == 0 else 3 - self.player_id
+            best = np.full(len(codes[k]), -np.inf if player == 1 else np.inf)
+            (np.maximum if player == 1 else np.minimum).at(best, parents[k + 1], values)
+            is_best = np.flatnonzero(values == best[parents[k + 1]])
+            best_children[k] = np.full(len(codes[k]), len(values))
+            np.minimum.at(best_children[k], parents[k + 1][is_best], is_best)
+
+            status = STATUS[codes[k]]
+            values = np.where(status == GameStatus.RUNNING, self.gamma * best, _STATUS_REWARDS[status])
+
+        # follow the principal variation down to its leaf
+        node, k = 0, 0
+        while k < depth and STATUS[codes[k][node]] == GameStatus.RUNNING:
+            node = best_children[k][node]
+            k += 1
+        self.leaves.append(CANON_ID[codes[k][node]])
+
+        self.move_nodes.append(nodes)
+        self.move_times.append(time.perf_counter() - start)
+        return squares[1][best_children[0][0]] + 1, values[0]
+
+    def search_stats(self):
+        stats = super().search_stats()
+        stats["leaves_per_move"] = self.leaf_count / stats["moves"] if stats["moves"] else 0
+        return stats
+
+    def play_policy_move(self):
+        """
+        get agent to play the best move with epsilon chance of playing a random move
+        :return: GAME_STATUS of game after executing move
+        """
+        if self.rng.random() < self.epsilon:
+            move = self.rng.choice(self.game.get_legals())
+            self.leaves.append(self.game.sim_move(move, self.player_id).canonical_id())
+            return self.play_move(move)
+        else:
+            return self.play_move(self.get_best_move())
+
+    def train(self, afterstates, reward):
+        """
+        Update the value function using TD(lambda) over the principal variation leaves of the last game.
+        The leaves were recorded while playing, so afterstates is only used to check we actually played a move.
+
+        :param afterstates: list of Boards (or array of board codes), corresponding to all the game states AFTER our agent has played
+        :param reward: +1 for p1 win, -1 for p2 win, 0 for draw
+        :return: None
+        """
+        if len(afterstates) == 0 or not self.leaves:
+            return
+        leaves = np.array(self.leaves)
+        status = STATUS[leaves]
+        terminal = status != GameStatus.RUNNING
+
+        # terminal leaves are worth exactly their reward
+        self.value.table[leaves[terminal]] = _STATUS_REWARDS[status[terminal]]
+        self.value.seen[leaves] = True
+
+        # TD errors between consecutive leaves, then the last leaf against the final reward
+        values = self.value.table[leaves]
+        errors = np.append(self.gamma * values[1:], reward) - values
+
+        # lambda-return update: leaf t moves by alpha * sum_{j>=t} lambda^(j-t) * error_j
+        updates = np.zeros(len(leaves))
+        acc = 0
+        for t in range(len(leaves) - 1, -1, -1):
+            acc = errors[t] + self.lambda_ * acc
+            updates[t] = acc
+        updates[terminal] = 0
+        np.add.at(self.value.table, leaves, self.alpha * updates)
 
 
 class EpsilonAgent(_AgentABC):
@@ -141,9 +524,13 @@ class EpsilonAgent(_AgentABC):
     Load a pre-trained value function with load_value().
     """
 
-    def __init__(self, player_id, alpha=0.1, gamma=0.9, epsilon=0.1, board=None):
+    def __init__(self, player_id, alpha=0.1, gamma=0.9, epsilon=0.1, board=None, value=None, rng=None):
         self.epsilon = epsilon  # exploration rate
-        super().__init__(player_id, alpha, gamma, board=board)
+        super().__init__(player_id, alpha, gamma, board=board, value=value, rng=rng)
+
+        # afterstates get_best_move found in the value fn, and ones it had to initialize
+        self.value_hits = 0
+        self.value_misses = 0
 
     def get_value(self, board):
         return self.value[board]
@@ -154,9 +541,8 @@ class EpsilonAgent(_AgentABC):
         :return: GAME_STATUS of game after executing move
         """
 
-        if random.random() < self.epsilon:
-            legals = self.game.get_legals()
-            return self.play_move(np.random.choice(legals))
+        if self.rng.random() < self.epsilon:
+            return self.play_move(self.rng.choice(self.game.get_legals()))
         else:
             return self.play_move(self.get_best_move())
 
@@ -167,6 +553,20 @@ class EpsilonAgent(_AgentABC):
         Negative value is good for O
         :return: # from 1-9 indicating the best move
         """
+        if hasattr(self.value, "move_values"):
+            # value stores which can look up every afterstate at once (e.g. ValueStore.ArrayValue)
+            misses = 0
+
+            def init(n):
+                nonlocal misses
+                misses = n
+                return self._init_values(n)
+
+            moves, values = self.value.move_values(self.game, init)
+            self.value_hits += len(moves) - misses
+            self.value_misses += misses
+            return moves[values.argmax() if self.player_id == 1 else values.argmin()]
+
         best_value = None
         best_move = None
 
@@ -179,8 +579,11 @@ class EpsilonAgent(_AgentABC):
             afterstate = self.game.sim_move(move, self.player_id)
 
             # add state to value fn on first visit
-            if afterstate not in self.value.keys():
-                self.value[afterstate] = random.uniform(-1, 1)
+            if afterstate not in self.value:
+                self.value[afterstate] = self._init_values(1)[0]
+                self.value_misses += 1
+            else:
+                self.value_hits += 1
 
             move_value = self.value[afterstate]
 
@@ -194,37 +597,102 @@ class EpsilonAgent(_AgentABC):
 
         return best_move
 
+    def _init_values(self, n):
+        """
+        initial values for n states being added to the value fn
+        """
+        return self.rng.uniform(-1, 1, n)
+
     def train(self, afterstates, reward):
         raise NotImplementedError("base class EpsilonAgent doesn't know how to train()")
 
+    def train_batch(self, codes, lengths, rewards):
+        """
+        Train on many games at once.
+        This version just calls train() on each game. Subclasses vectorize it for ArrayValue stores
+        :param codes: (n_games, max_length) array of the agent's afterstate codes in each game, padded with -1.
+                      e.g. BatchPlay.afterstates()
+        :param lengths: number of afterstates in each game
+        :param rewards: reward of each game: +1 for p1 win, -1 for p2 win, 0 for draw
+        :return: None
+        """
+        for row, length, reward in zip(codes, lengths.tolist(), rewards.tolist()):
+            self.train(row[:length], reward)
+
 
 class TDAgent(EpsilonAgent):
     """
     An agent that learns w/ TD(0) and epsilon-greedy policy.
+    Optionally keeps past games in a Replay.ReplayBuffer, and trains on replay_ratio replayed games per new game.
     """
+    def __init__(self, player_id, alpha=0.1, gamma=0.9, epsilon=0.1, board=None, value=None,
+                 replay=None, replay_ratio=0, rng=None):
+        """
+        :param replay: optional Replay.ReplayBuffer to store games in and replay them from (3x3 Boards only)
+        :param replay_ratio: replayed games to train on per new game. can be fractional, e.g. 0.5 is every other game
+        """
+        super().__init__(player_id, alpha, gamma, epsilon, board=board, value=value, rng=rng)
+        self.replay = replay
+        self.replay_ratio = replay_ratio
+        self._replay_credit = 0.0  # fractional replayed games owed
+
     def train(self, afterstates, reward):
         """
         Update the value function using TD(0) update for value fn.
         Doesn't need to be online since states are never re-visited during an episode
+        With a replay buffer, the game is then stored, and replayed games are trained on too.
 
-        :param afterstates: list of Boards, corresponding to all the game states AFTER our agent has played
+        :param afterstates: list of Boards, corresponding to all the game states AFTER our agent has played.
+                            can also be an array of board codes, e.g. Trajectory.afterstates()
         :param reward: +1 for p1 win, -1 for p2 win, 0 for draw
-        :return: None
+        :return: largest absolute TD error of the updates made for this game
+        """
+        error = self._update(afterstates, reward)
+        if self.replay is None:
+            return error
+
+        codes = afterstates if isinstance(afterstates, np.ndarray) else [board.code for board in afterstates]
+        self.replay.add(codes, reward, error)
+
+        self._replay_credit += self.replay_ratio
+        n = int(self._replay_credit)
+        if n:
+            self._replay_credit -= n
+            slots, codes, lengths, rewards = self.replay.sample(n, self.rng.generator)
+            errors = [self._update(row[:length], r)
+                      for row, length, r in zip(codes, lengths.tolist(), rewards.tolist())]
+            self.replay.update_priorities(slots, errors)
+        return error
+
+    def _update(self, afterstates, reward):
         """
+        TD(0) update for one game
+        :return: largest absolute TD error of the updates
+        """
+        if isinstance(afterstates, np.ndarray):
+            if isinstance(self.value, ArrayValue):
+                return self._train_codes(afterstates, reward)
+            afterstates = [Board.from_code(code) for code in afterstates.tolist()]
+
+        error = 0.0
         # update value of last afterstate.
         # if we played the final move, then the afterstate is a terminal state,
         #   so we set the afterstate value to be *exactly* the transition reward
-        if afterstates[-1].running_state() != GameStatus.RUNNING:
+        #   same goes for a last afterstate we've never valued (e.g. it came from a random move)
+        if afterstates[-1].running_state() != GameStatus.RUNNING or afterstates[-1] not in self.value:
+            if afterstates[-1] in self.value:
+                error = abs(reward - self.value[afterstates[-1]])
             self.value[afterstates[-1]] = reward
         else:
             # Future rewards are zero, so move value towards actual reward
             expected_reward = self.value[afterstates[-1]]
             self.value[afterstates[-1]] = expected_reward + self.alpha * (reward - expected_reward)
+            error = abs(reward - expected_reward)
 
         # remaining updates bootstrap toward the next afterstate
         next_afterstate = afterstates[-1]  # start at the end, iterate backwards.
         for afterstate in afterstates[-1::-1]:
-            if afterstate not in self.value.keys():
+            if afterstate not in self.value:
                 # sometimes states don't make it into our value function during play (usually due to random moves)
                 self.value[afterstate] = self.gamma*self.value[next_afterstate]
             else:
@@ -232,8 +700,81 @@ class TDAgent(EpsilonAgent):
                 future_value = self.gamma * self.value[next_afterstate]
                 current_value = self.value[afterstate]
                 self.value[afterstate] = current_value + self.alpha * (future_value - current_value)
+                error = max(error, abs(future_value - current_value))
 
             next_afterstate = afterstate
+        return error
+
+    def _train_codes(self, codes, reward):
+        """
+        _update() on an array of board codes, straight into an ArrayValue's table. Same updates as _update()
+        """
+        table, seen = self.value.table, self.value.seen
+        ids = CANON_ID[codes].tolist()
+
+        error = 0.0
+        last = ids[-1]
+        if STATUS[codes[-1]] != GameStatus.RUNNING or not seen[last]:
+            if seen[last]:
+                error = abs(reward - table[last])
+            table[last] = reward
+            seen[last] = True
+        else:
+            error = abs(reward - table[last])
+            table[last] += self.alpha * (reward - table[last])
+
+        next_id = last
+        for i in reversed(ids):
+            if not seen[i]:
+                table[i] = self.gamma * table[next_id]
+                seen[i] = True
+            else:
+                delta = self.gamma * table[next_id] - table[i]
+                table[i] += self.alpha * delta
+                error = max(error, abs(delta))
+            next_id = i
+        return float(error)
+
+    def train_batch(self, codes, lengths, rewards):
+        """
+        TD(0) on a batch of games, vectorized across games.
+        The backward sweep runs one depth at a time: every game's last afterstate is updated, then every game's
+        second to last, and so on. Per-game training instead finishes each game before starting the next.
+        The two give the same values when no state appears in more than one game in the batch. Otherwise:
+          - updates to the same state at the same depth are applied in game order, exactly as train() would,
+            but their TD targets use the values after the previous depth was updated in *every* game
+          - a state which appears at different depths in different games is updated in depth order, not game order
+        so the difference grows with batch size (small batches of tens of games stay close to per-game training).
+        Like train(), the last afterstate of each game also gets bootstrapped toward gamma * its own value.
+        Needs an ArrayValue; other value stores fall back to per-game train().
+        :param codes: (n_games, max_length) array of the agent's afterstate codes in each game, padded with -1
+        :param lengths: number of afterstates in each game
+        :param rewards: reward of each game: +1 for p1 win, -1 for p2 win, 0 for draw
+        :return: None
+        """
+        if not isinstance(self.value, ArrayValue):
+            return super().train_batch(codes, lengths, rewards)
+        lengths = np.asarray(lengths)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        games = np.flatnonzero(lengths > 0)
+        alpha, gamma = self.alpha, self.gamma
+
+        # last afterstates: move toward the reward (or set to it, if terminal/unseen), then toward gamma * itself
+        last = codes[games, lengths[games] - 1]
+        c = 1 - alpha + alpha * gamma
+        reward = rewards[games]
+        _sequential_updates(self.value, CANON_ID[last], c * (1 - alpha), c * alpha * reward, c * reward,
+                            STATUS[last] != GameStatus.RUNNING)
+
+        # then back through the rest of each game, bootstrapping toward the next afterstate
+        next_ids = CANON_ID[last]
+        for depth in range(2, lengths.max(initial=0) + 1):
+            playing = lengths[games] >= depth
+            games, next_ids = games[playing], next_ids[playing]
+            ids = CANON_ID[codes[games, lengths[games] - depth]]
+            target = gamma * self.value.table[next_ids]
+            _sequential_updates(self.value, ids, 1 - alpha, alpha * target, target, np.zeros(len(ids), dtype=bool))
+            next_ids = ids
 
 
 class MCAgent(EpsilonAgent):
@@ -243,118 +784,107 @@ class MCAgent(EpsilonAgent):
     def train(self, afterstates, reward):
         """
         Update the value function using the bellman equation
-        :param afterstates: list of Boards, corresponding to a single game
+        :param afterstates: list of Boards, corresponding to a single game.
+                            can also be an array of board codes, e.g. Trajectory.afterstates()
         :param reward: +1 for p1 win, -1 for p2 win, 0 for draw
         :return: None
         """
+        if isinstance(afterstates, np.ndarray):
+            if isinstance(self.value, ArrayValue):
+                return self._train_codes(afterstates, reward)
+            afterstates = [Board.from_code(code) for code in afterstates.tolist()]
+
         for decay_steps, afterstate in enumerate(reversed(afterstates)):
             rtn = reward * self.gamma**decay_steps  # decayed future reward (i.e. return)
-            if afterstate not in self.value.keys():
+            if afterstate not in self.value:
                 self.value[afterstate] = rtn
             # incorporate trajectory into average
             self.value[afterstate] = self.value[afterstate] + self.alpha*(rtn-self.value[afterstate])
 
+    def _train_codes(self, codes, reward):
+        """
+        train() on an array of board codes, straight into an ArrayValue's table. Same updates as train()
+        """
+        table, seen = self.value.table, self.value.seen
+        for decay_steps, i in enumerate(reversed(CANON_ID[codes].tolist())):
+            rtn = reward * self.gamma**decay_steps
+            if not seen[i]:
+                table[i] = rtn
+                seen[i] = True
+            table[i] += self.alpha * (rtn - table[i])
+
+    def train_batch(self, codes, lengths, rewards):
+        """
+        Monte Carlo update on a batch of games at once. Matches per-game train() up to rounding:
+        a state updated k times in the batch gets the closed form of k updates in a row, in game order.
+        Needs an ArrayValue; other value stores fall back to per-game train().
+        :param codes: (n_games, max_length) array of the agent's afterstate codes in each game, padded with -1
+        :param lengths: number of afterstates in each game
+        :param rewards: reward of each game: +1 for p1 win, -1 for p2 win, 0 for draw
+        :return: None
+        """
+        if not isinstance(self.value, ArrayValue):
+            return super().train_batch(codes, lengths, rewards)
+        lengths = np.asarray(lengths)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        played = np.arange(codes.shape[1]) < lengths[:, None]
+
+        # return of each afterstate: reward decayed by the number of moves left until the end of the game
+        decay_steps = lengths[:, None] - 1 - np.arange(codes.shape[1])
+        returns = (rewards[:, None] * self.gamma ** np.maximum(decay_steps, 0))[played]
+        ids = CANON_ID[codes[played]]  # row major, so in game order
+        _sequential_updates(self.value, ids, 1 - self.alpha, self.alpha * returns, returns,
+                            np.zeros(len(ids), dtype=bool))
+
 
 if __name__ == "__main__":
     """
     Examine and test the value function specified by value_path.
     Compare that value function with an optimal value function
     """
-    x_value_path = "D:\Programming\GithubRepos\TicTacToeRL\src\TDValueX.json"
-    o_value_path = "D:\Programming\GithubRepos\TicTacToeRL\src\TDValueO.json"
-    optimal_value_path = "D:\Programming\GithubRepos\TicTacToeRL\src\DPValue.json"
+    import Evaluator
+    import DPSolver
+    import os
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    x_value_path = os.path.join(src_dir, "TDValueX.json")
+    o_value_path = os.path.join(src_dir, "TDValueO.json")
     p1 = EpsilonAgent(1, epsilon=0).load_value(x_value_path)
     p2 = EpsilonAgent(2, epsilon=0).load_value(o_value_path)
     jointvalue = p1.value | p2.value  # merge the two value functions, for getting statistics
-    p1.value = jointvalue
-    p2.value = jointvalue
 
     for startermove in [1, 2, 5]:
-        outcome, gamelog = play_match(p1, p2, epsilon=0, startermove=startermove)
+        outcome, gamelog = play_match(p1, p2, startermove=startermove)
         for boardstate in gamelog:
-            print(f"value={p1.value[boardstate]}")
+            print(f"value={jointvalue[boardstate]}")
             print(boardstate)
             print("\n" * 2)
 
-    opt_agent_X = EpsilonAgent(1, epsilon=0)
-    opt_agent_O = EpsilonAgent(2, epsilon=0)  # create an optimal "O" player
-
-    opt_agent_X.load_value(optimal_value_path)
-    opt_agent_O.value = opt_agent_X.value
+    optimal = DPSolver.optimal_value_fn(p1.gamma)
+    opt_agent_X = Evaluator.optimal_agent(1, optimal)
+    opt_agent_O = Evaluator.optimal_agent(2, optimal)  # create an optimal "O" player
 
-    terminals_missing = [0,0,0]  # number of [draws, X-win, O-win] states not found in p1.value
-    sq_error = 0
-    for state in opt_agent_X.value:
-        if state in p1.value:
-            sq_error += (p1.value[state] - opt_agent_X.value[state]) ** 2
-        else:
-            if (r := state.running_state()) in [0,1,2]:
-                terminals_missing[r] += 1
+    terminals_missing = [0,0,0]  # number of [draws, X-win, O-win] states not found in jointvalue
+    for state in optimal:
+        if state not in jointvalue and (r := state.running_state()) in [0,1,2]:
+            terminals_missing[r] += 1
 
-    rmse = np.sqrt((sq_error / len(p1.value)))
+    rmse, _ = Evaluator.rmse(jointvalue, [state.code for state in jointvalue], optimal)
     print(f"Among seen states, value function has average error (RMSE) of {rmse:.3f}")
-    print(f"There are {len(opt_agent_X.value) - len(p1.value)} unseen states")
+    print(f"There are {len(optimal) - len(jointvalue)} unseen states")
     print(f"Of the unseen states, {sum(terminals_missing)} are terminal states.")
     print(f"{terminals_missing[0]} are drawn states, {terminals_missing[1]} are X-wins, {terminals_missing[2]} are O-wins")
     print(f"For reference, there exist 135 winning states (states where a player has won)")
-
-    # play out a game w/ learned agent vs optimal
-    p_vs_opt = []
-    opt_vs_p = []
-    strmap = lambda a: "X win" if a==1 else "O win" if a==2 else "Draw"
-    for startermove in [1,5,2]:
-        outcome, _ = play_match(p1, opt_agent_O, startermove=startermove)
-        p_vs_opt.append(strmap(outcome))
-        outcome, _ = play_match(opt_agent_X, p2, startermove=startermove)
-        opt_vs_p.append(strmap(outcome))
     print()
-    print("Learned Agent as X, Optimal Agent as O")
-    print("Corner Middle Side")
-    print(p_vs_opt)
 
-    print()
-    print("Optimal Agent as X, Learned Agent as O")
-    print("Corner Middle Side")
-    print(opt_vs_p)
-
-    print()
-    print("playing out 1000 games vs random opponent...")
-    # p1 and optimal agent both play out 1000 games vs random opponent, as both X and O
-    p_scores_X = np.array([0,0,0])
-    opt_scores_X = np.array([0,0,0])
-    p_scores_O = np.array([0,0,0])
-    opt_scores_O = np.array([0,0,0])
-
-    # random agents
-    rand_agent_X = EpsilonAgent(1, epsilon=1)
-    rand_agent_O = EpsilonAgent(2, epsilon=1)
-    for i in range(1000):
-
-        # player, X
-        outcome, _ = play_match(p1, rand_agent_O)
-        p_scores_X[outcome] += 1
-
-        # optimal, X
-        outcome, _ = play_match(opt_agent_X, rand_agent_O)
-        opt_scores_X[outcome] += 1
-
-        # player, O
-        outcome, _ = play_match(rand_agent_X, p2)
-        p_scores_O[outcome] += 1
-
-        # optimal, O
-        outcome, _ = play_match(rand_agent_X, opt_agent_O)
-        opt_scores_O[outcome] += 1
-
-    p_rates_X = (p_scores_X/1000)[[1, 0, 2]]
-    p_rates_O = (p_scores_O/1000)[[2, 0, 1]]
-    opt_rates_X = (opt_scores_X/1000)[[1, 0, 2]]
-    opt_rates_O = (opt_scores_O/1000)[[2, 0, 1]]
-    print(f"Learned Value fn outcome rates vs random opponent...\n"
-          f"     W    D    L\n"
-          f"X: {p_rates_X}\n"
-          f"O: {p_rates_O}\n\n"
-          f"Optimal Value fn outcome rates vs random opponent...\n"
-          f"     W    D    L\n"
-          f"X: {opt_rates_X}\n"
-          f"O: {opt_rates_O}\n")
+    # exact outcome rates, rather than playing out games
+    Evaluator.print_evaluation("Learned Agent as X vs Optimal Agent", Evaluator.evaluate(p1, opt_agent_O, optimal))
+    Evaluator.print_evaluation("Learned Agent as O vs Optimal Agent", Evaluator.evaluate(p2, opt_agent_X, optimal))
+    Evaluator.print_evaluation("Learned Agent as X vs random opponent",
+                               Evaluator.evaluate(p1, Evaluator.random_agent(2), optimal))
+    Evaluator.print_evaluation("Learned Agent as O vs random opponent",
+                               Evaluator.evaluate(p2, Evaluator.random_agent(1), optimal))
+    Evaluator.print_evaluation("Optimal Agent as X vs random opponent",
+                               Evaluator.evaluate(opt_agent_X, Evaluator.random_agent(2), optimal))
+    Evaluator.print_evaluation("Optimal Agent as O vs random opponent",
+                               Evaluator.evaluate(opt_agent_O, Evaluator.random_agent(1), optimal))
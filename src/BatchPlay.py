@@ -0,0 +1,142 @@
+"""
+Play many games of Tic Tac Toe at once, as numpy arrays.
+Every game in the batch is advanced one ply per step, so each step costs a handful of numpy calls
+regardless of how many games are being played.
+"""
+from TicTacToe import Board, GameStatus, DIGITS, POW3, CANON_ID, STATUS
+from ValueStore import ArrayValue
+import numpy as np
+
+# reward for each GameStatus (DRAW, P1_WIN, P2_WIN)
+REWARDS = np.array([0, 1, -1])
+
+
+def _choose_moves(agent, codes, player, rng):
+    """
+    Epsilon-greedy moves for a batch of positions, following EpsilonAgent.play_policy_move
+    :param agent: EpsilonAgent backed by an ArrayValue
+    :param codes: encodings of the positions, all with `player` to move
+    :param player: 1 for X, 2 for O
+    :param rng: numpy Generator
+    :return: array of squares (0-8) to play on
+    """
+    legal = DIGITS[codes] == 0
+    moves = np.empty(len(codes), dtype=np.int64)
+
+    # random moves: pick the legal square with the largest random key
+    explore = rng.random(len(codes)) < agent.epsilon
+    if explore.any():
+        keys = rng.random((np.count_nonzero(explore), 9))
+        keys[~legal[explore]] = -1
+        moves[explore] = keys.argmax(axis=1)
+
+    greedy = ~explore
+    if greedy.any():
+        legal = legal[greedy]
+        # canonical id of every afterstate. illegal squares point at id 0, and are masked out below
+        afterstates = CANON_ID[np.where(legal, codes[greedy, None] + player * POW3, 0)]
+
+        # add states to value fn on first visit
+        new = afterstates[legal & ~agent.value.seen[afterstates]]
+        agent.value.table[new] = rng.uniform(-1, 1, len(new))
+        agent.value.seen[new] = True
+
+        # p1 wants to maximize value, p2 wants to minimize. argmax keeps the first best move, like get_best_move
+        values = agent.value.table[afterstates] * (1 if player == 1 else -1)
+        values[~legal] = -np.inf
+        moves[greedy] = values.argmax(axis=1)
+
+    return moves
+
+
+def play_matches(agent1, agent2, n_games, startermove=None, rng=None):
+    """
+    Get two EpsilonAgents to play n_games against each other, all at the same time.
+    Batched version of Agent.play_match. Both agents must store their values in a ValueStore.ArrayValue.
+    :param agent1: agent playing as X
+    :param agent2: agent playing as O
+    :param n_games: number of games to play
+    :param startermove: optional starter move (1-9), either one for every game or an array with one per game
+    :param rng: optional numpy Generator. defaults to the generator of agent1's RandomStream
+    :return: outcomes: GameStatus of each game,
+             log: (n_games, 9) array of board encodings after each ply, padded with -1,
+             lengths: number of plies in each game
+    """
+    for agent in (agent1, agent2):
+        if not isinstance(agent.value, ArrayValue):
+            raise TypeError("play_matches needs agents whose value is a ValueStore.ArrayValue")
+    rng = agent1.rng.generator if rng is None else rng
+
+    codes = np.zeros(n_games, dtype=np.int64)
+    status = np.full(n_games, GameStatus.RUNNING, dtype=np.int8)
+    log = np.full((n_games, 9), -1, dtype=np.int32)
+    lengths = np.zeros(n_games, dtype=np.int64)
+
+    for ply in range(9):
+        running = np.flatnonzero(status == GameStatus.RUNNING)
+        if len(running) == 0:
+            break
+        player = 1 if ply % 2 == 0 else 2
+        agent = agent1 if player == 1 else agent2
+
+        if ply == 0 and startermove is not None:
+            moves = np.broadcast_to(np.asarray(startermove) - 1, (n_games,))[running]
+        else:
+            moves = _choose_moves(agent, codes[running], player, rng)
+
+        afterstates = codes[running] + player * POW3[moves]
+        codes[running] = afterstates
+        status[running] = STATUS[afterstates]
+        log[running, ply] = afterstates
+        lengths[running] += 1
+
+    return status, log, lengths
+
+
+def game_logs(log, lengths):
+    """
+    Turn the log from play_matches into lists of Boards, the same as the game_log returned by Agent.play_match.
+    game_logs(...)[i][::2] are X's afterstates in game i, and [1::2] are O's.
+    :param log: array of board encodings, padded with -1
+    :param lengths: number of plies in each game
+    :return: list of [Board] for each game
+    """
+    return [[Board.from_code(code) for code in row[:length]] for row, length in zip(log.tolist(), lengths.tolist())]
+
+
+def afterstates(log, lengths, player):
+    """
+    One player's afterstates from the log of play_matches, in the form train_batch() takes
+    :param log: array of board encodings, padded with -1
+    :param lengths: number of plies in each game
+    :param player: 1 for X, 2 for O
+    :return: (array of the player's afterstate encodings, padded with -1, number of afterstates in each game)
+    """
+    if player == 1:
+        return log[:, 0::2], (lengths + 1) // 2
+    return log[:, 1::2], lengths // 2
+
+
+if __name__ == "__main__":
+    """
+    Compare games/sec of play_matches against serial play_match
+    """
+    from Agent import TDAgent, play_match
+    import time
+
+    p1 = TDAgent(1, value=ArrayValue())
+    p2 = TDAgent(2, value=ArrayValue())
+
+    n = 2000
+    start = time.perf_counter()
+    for i in range(n):
+        play_match(p1, p2, startermove=[1, 2, 5][i % 3])
+    serial = n / (time.perf_counter() - start)
+
+    n = 100_000
+    start = time.perf_counter()
+    play_matches(p1, p2, n, startermove=np.resize([1, 2, 5], n))
+    batched = n / (time.perf_counter() - start)
+
+    print(f"play_match: {serial:.0f} games/sec")
+    print(f"play_matches: {batched:.0f} games/sec ({batched / serial:.1f}x)")
@@ -0,0 +1,154 @@
+"""
+Save value functions on a background thread, so training doesn't wait on disk.
+"""
+import NTuple
+import ValueFile
+import atexit
+import json
+import os
+import pickle
+import threading
+
+
+def _snapshot(value):
+    """
+    cheap copy of a value function, so training can carry on changing the original while it's written
+    """
+    return value.copy()
+
+
+def write_value(rpath, value):
+    """
+    Write a value function to rpath atomically: it's written to a temporary file which then replaces rpath,
+    so rpath always holds a complete value function
+    :param rpath: .json path, or path ending in ValueFile.EXTENSION for the binary format
+    :param value: ArrayValue or {Board: float} dict, or anything with its own save() (e.g. RunState).
+                  NTupleValues are always written as .npz files, with rpath's suffix swapped for NTuple.EXTENSION
+    """
+    if isinstance(value, NTuple.NTupleValue):
+        rpath = NTuple.npz_path(rpath)
+    tmp_path = rpath + ".tmp"
+    if hasattr(value, "save"):
+        value.save(tmp_path)
+    elif rpath.endswith(ValueFile.EXTENSION):
+        ValueFile.save(tmp_path, value)
+    else:
+        with open(tmp_path, "w") as f:
+            json.dump({str(board): val for board, val in value.items()}, f)
+    os.replace(tmp_path, rpath)
+
+
+class RunState:
+    """
+    Snapshot of everything a training run needs to carry on exactly where it left off.
+    It's pickled as soon as it's made, all in one go: objects shared between parts of the state (e.g. an agent and a
+    tracker holding that agent) stay shared, and training can carry on changing things while it's written.
+    Write it with CheckpointWriter.save((rpath, run_state)), so it's written atomically like the value fns
+    """
+    def __init__(self, **state):
+        self.data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def copy(self):
+        return self  # already a snapshot
+
+    def save(self, rpath):
+        with open(rpath, "wb") as f:
+            f.write(self.data)
+
+    @staticmethod
+    def load(rpath):
+        """
+        :return: dict of the state, as it was passed to RunState()
+        """
+        with open(rpath, "rb") as f:
+            return pickle.load(f)
+
+
+class CheckpointWriter:
+    """
+    Background writer for value functions.
+    save() snapshots the values and returns straight away. If a save comes in while a write is still running,
+    it's merged into any save that hasn't started yet: the newest value for each path replaces older ones for the same
+    path, so only the newest values are written, and files saved by earlier calls still get written.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = None  # newest snapshots waiting to be written: {path: value}
+        self._writing = False
+        self._closed = False
+        self.error = None  # exception raised by the last failed write
+
+        # stats
+        self.written = 0  # number of snapshots written
+        self.coalesced = 0  # number of saves merged into one still waiting to be written
+
+        self._thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def save(self, *path_values):
+        """
+        Queue value functions to be written
+        :param path_values: (rpath, value) pairs, e.g. save((p1_path, p1.value), (p2_path, p2.value))
+        """
+        snapshot = [(rpath, _snapshot(value)) for rpath, value in path_values]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("CheckpointWriter is closed")
+            if self._pending is None:
+                self._pending = {}
+            else:
+                self.coalesced += 1
+            self._pending.update(snapshot)
+            self._cond.notify_all()
+
+    def flush(self):
+        """
+        Block until every queued snapshot has been written
+        """
+        with self._cond:
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Write anything still queued, then stop the background thread. Safe to call more than once
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return  # closed, and nothing left to write
+                snapshot, self._pending = self._pending, None
+                self._writing = True
+
+            try:
+                for rpath, value in snapshot.items():
+                    write_value(rpath, value)
+                self.written += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,142 @@
+"""
+Track how close agents' value functions are to the optimal one during training, and decide when to stop.
+"""
+from collections.abc import Mapping
+from StateSpace import get_state_space
+from TicTacToe import Board, N_CODES
+from ValueStore import ArrayValue
+import DPSolver
+import numpy as np
+
+
+class ConvergenceTracker:
+    """
+    RMSE against the optimal values over the states an agent has valued, and the rate its greedy move agrees with an
+    optimal move. Each check only redoes the work for states whose value changed since the last check.
+    The greedy move is the best afterstate by value, so for agents which pick moves by searching deeper (e.g.
+    TDLeafAgent) agreement is about the value fn, not the moves they actually play.
+    """
+    def __init__(self, agent, optimal=None):
+        """
+        :param agent: agent whose value fn to track
+        :param optimal: optimal ArrayValue. defaults to DPSolver.optimal_value_fn(agent.gamma)
+        """
+        self.agent = agent
+        self.optimal = DPSolver.optimal_value_fn(agent.gamma) if optimal is None else optimal
+        self.space = get_state_space()
+
+        # value fn as of the last check
+        self.table = np.zeros(N_CODES)
+        self.seen = np.zeros(N_CODES, dtype=bool)
+        self.sq_error = 0.0  # sum of squared errors over seen states
+
+        # positions where the agent chooses a move, and the afterstates of their moves
+        space = self.space
+        self.rows = np.flatnonzero((space.to_move == agent.player_id) & ~space.terminal)
+        self.afterstates = space.afterstates[self.rows]
+        legal = self.afterstates >= 0
+        self.legal = legal
+        sign = 1 if agent.player_id == 1 else -1
+        opt_values = np.where(legal, sign * self.optimal.table[np.maximum(self.afterstates, 0)], -np.inf)
+        self.optimal_moves = np.isclose(opt_values, opt_values.max(axis=1, keepdims=True)) & legal
+        self.sign = sign
+
+        self.positions = len(self.rows)  # number of positions where the agent picks a move
+        self.valued = np.zeros(len(self.rows), dtype=bool)  # positions where every move has a value
+        self.agree = np.zeros(len(self.rows), dtype=bool)  # positions where the greedy move is optimal
+
+    def _current(self):
+        """
+        :return: (table, seen) of the agent's value fn, by canonical id
+        """
+        value = self.agent.value
+        if isinstance(value, ArrayValue):
+            return value.table, value.seen
+        table = np.zeros(N_CODES)
+        seen = np.zeros(N_CODES, dtype=bool)
+        if not isinstance(value, Mapping):
+            # value fns which can't be listed (e.g. NTuple.NTupleValue) have a value for every board,
+            # so look up every reachable position
+            ids = self.space.ids
+            table[ids] = [value[Board.from_code(i)] for i in ids.tolist()]
+            seen[ids] = True
+            return table, seen
+        for board, v in value.items():
+            table[board.canonical_id()] = v
+            seen[board.canonical_id()] = True
+        return table, seen
+
+    def update(self):
+        """
+        Bring the stats up to date with the agent's value fn
+        :return: (RMSE over valued states, greedy/optimal move agreement over positions where every move is valued,
+                  number of such positions)
+        """
+        table, seen = self._current()
+        changed = np.flatnonzero((table != self.table) | (seen != self.seen))
+
+        if len(changed):
+            # RMSE: swap the old squared errors of changed states for their new ones
+            optimal = self.optimal.table[changed]
+            old = np.where(self.seen[changed], (self.table[changed] - optimal) ** 2, 0)
+            new = np.where(seen[changed], (table[changed] - optimal) ** 2, 0)
+            self.sq_error += new.sum() - old.sum()
+            self.table[changed] = table[changed]
+            self.seen[changed] = seen[changed]
+
+            # agreement: redo positions with a move whose afterstate changed
+            is_changed = np.zeros(N_CODES, dtype=bool)
+            is_changed[changed] = True
+            redo = np.flatnonzero((is_changed[np.maximum(self.afterstates, 0)] & self.legal).any(axis=1))
+            afterstates, legal = np.maximum(self.afterstates[redo], 0), self.legal[redo]
+            self.valued[redo] = (self.seen[afterstates] | ~legal).all(axis=1)
+            values = np.where(legal, self.sign * self.table[afterstates], -np.inf)
+            greedy = values.argmax(axis=1)
+            self.agree[redo] = self.optimal_moves[redo, greedy]
+
+        n_seen = np.count_nonzero(self.seen)
+        rmse = np.sqrt(max(self.sq_error, 0) / n_seen) if n_seen else np.nan
+        n_valued = np.count_nonzero(self.valued)
+        agreement = np.count_nonzero(self.agree & self.valued) / n_valued if n_valued else np.nan
+        return float(rmse), float(agreement), int(n_valued)
+
+
+class EarlyStopping:
+    """
+    Stop training once every agent has been within the thresholds for `window` checks in a row
+    """
+    def __init__(self, agents, max_rmse=None, min_agreement=None, window=5, optimal=None, min_coverage=None):
+        """
+        :param agents: agents being trained
+        :param max_rmse: stop only once RMSE against the optimal values is at most this. None to ignore RMSE
+        :param min_agreement: stop only once greedy moves agree with optimal moves at least this often. None to ignore
+        :param window: number of checks in a row the thresholds have to hold for
+        :param optimal: optimal ArrayValue, shared by the trackers
+        :param min_coverage: stop only once every move has a value in at least this fraction of the positions each agent
+                             picks moves in. agreement and RMSE are only measured over valued states, so without this
+                             they can look converged while most of the game is unexplored. None to ignore
+        """
+        optimal = DPSolver.optimal_value_fn(agents[0].gamma) if optimal is None else optimal
+        self.trackers = [ConvergenceTracker(agent, optimal) for agent in agents]
+        self.max_rmse = max_rmse
+        self.min_agreement = min_agreement
+        self.window = window
+        self.min_coverage = min_coverage
+        self.streak = 0  # checks in a row the thresholds have held
+        self.last = None  # [(rmse, agreement, positions)] for each agent, from the last check
+
+    def check(self):
+        """
+        :return: True if training should stop
+        """
+        self.last = [tracker.update() for tracker in self.trackers]
+        if self.max_rmse is None and self.min_agreement is None:
+            return False
+        converged = all(
+            (self.max_rmse is None or rmse <= self.max_rmse)
+            and (self.min_agreement is None or agreement >= self.min_agreement)
+            and (self.min_coverage is None or n_valued >= self.min_coverage * tracker.positions)
+            for tracker, (rmse, agreement, n_valued) in zip(self.trackers, self.last)
+        )
+        self.streak = self.streak + 1 if converged else 0
+        return self.streak >= self.window
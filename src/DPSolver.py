@@ -2,22 +2,25 @@
 A class to find the optimal value function of Tic Tac Toe using dynamic programming
 """
 
-from TicTacToe import Board, GameStatus
+from TicTacToe import GameStatus
+from StateSpace import CACHE_DIR, get_state_space
+from ValueStore import ArrayValue
+from CheckpointWriter import write_value
+import ValueFile
+import numpy as np
 import json
+import os
 ## generate states and transitions
-# start from empty board
-# create all board states after 1 move
-# create dict linking each board state to all resulting board states
-# repeat until full network of board states created, categorizing board states by how many moves have been played
+# StateSpace holds every reachable (canonical) board state, and the canonical id of each state's afterstates
 
 ## solve value function
 # start at 9-move boards
 # assign value to 9-move boards
 # look at 8-move boards
-# if 8-move board has NO afterstates, it must be a terminal board
+# if 8-move board is terminal
 #  - check who won, assign value
 # else its value is (decayed) min/max of afterstate values
-# repeat until all boards have assigned value
+# repeat until all boards have assigned value. each ply is solved at once with numpy
 
 def reward(outcome):
     match outcome:
@@ -29,39 +32,50 @@ def reward(outcome):
             return -1
 
 
-def optimal_value_fn():
-    player = 1  # 1 is X, 2 is O
+def _cache_path(gamma, rewards, cache_dir):
+    draw, p1_win, p2_win = rewards
+    return os.path.join(cache_dir, f"optimal_g{gamma!r}_r{draw!r}_{p1_win!r}_{p2_win!r}{ValueFile.EXTENSION}")
 
-    # generate all board states (with transitions)
-    states = []
-    b = Board()
-    states.append({b: [b.sim_move(move, player) for move in b.get_legals()]})
-    for i in range(1, 10):
-        states.append({})
-        player = (i % 2) + 1
-        for s, afterstates in states[i - 1].items():
-            if not afterstates:
-                continue
-            for a in afterstates:
-                # yes we waste computations, no it does not matter
-                if a.running_state() == GameStatus.RUNNING:
-                    states[i][a] = [a.sim_move(move, player) for move in a.get_legals()]
-                else:
-                    states[i][a] = []
+
+def optimal_value_fn(gamma=0.9, rewards=None, cache_dir=CACHE_DIR):
+    """
+    Solve for the optimal value of every reachable position.
+    Solved tables are cached in cache_dir, keyed by gamma and rewards, so later calls just read the file.
+    :param gamma: decay rate for future rewards
+    :param rewards: (draw, p1 win, p2 win) rewards. defaults to reward()
+    :param cache_dir: where to cache solved tables. None to turn caching off
+    :return: ArrayValue holding the value of every state
+    """
+    if rewards is None:
+        rewards = tuple(reward(outcome) for outcome in (GameStatus.DRAW, GameStatus.P1_WIN, GameStatus.P2_WIN))
+
+    if cache_dir is not None:
+        cache_path = _cache_path(gamma, rewards, cache_dir)
+        if os.path.exists(cache_path):
+            return ValueFile.load_value(cache_path)
+
+    space = get_state_space()
 
     # solve value function
-    value = {}
-    for i in range(9, -1, -1):
-        player = (i % 2) + 1
-        for state in states[i]:
-            if not states[i][state]:
-                # state is terminal
-                value[state] = reward(state.running_state())
-            else:
-                # state is non-terminal
-                minmax = max if player == 1 else min
-                value[state] = 0.9 * minmax([value[afterstate] for afterstate in states[i][state]])
+    value = ArrayValue()
+    terminal_reward = np.zeros(4)
+    terminal_reward[[GameStatus.DRAW, GameStatus.P1_WIN, GameStatus.P2_WIN]] = rewards
+    for rows in reversed(space.levels()):
+        player = space.to_move[rows[0]]
+        states, afterstates = space.ids[rows], space.afterstates[rows]
+        terminal = space.terminal[rows]
+
+        # state is terminal
+        value.table[states[terminal]] = terminal_reward[space.status[rows[terminal]]]
+        # state is non-terminal
+        afterstate_values = np.where(afterstates >= 0, value.table[afterstates], -np.inf if player == 1 else np.inf)
+        minmax = np.max if player == 1 else np.min
+        value.table[states[~terminal]] = gamma * minmax(afterstate_values[~terminal], axis=1)
+        value.seen[states] = True
 
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_value(cache_path, value)
     return value
 
 
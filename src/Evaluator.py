@@ -0,0 +1,137 @@
+"""
+Exact evaluation of agents: the probability of every outcome, worked out by walking the game tree once
+instead of sampling thousands of games.
+"""
+from Agent import EpsilonAgent
+from TicTacToe import Board, GameStatus, CANON_ID
+import DPSolver
+import copy
+import numpy as np
+
+# opening moves, as played by play_match's startermove. None lets X's policy choose
+OPENERS = {"Corner": 1, "Side": 2, "Centre": 5, "Any": None}
+
+
+def _frozen(agent):
+    """
+    copy of an agent with its own value fn, RandomStream, transposition table and stats, so evaluating doesn't
+    change anything about the original
+    """
+    # the value fn is copied with its own copy(), which is much cheaper than deepcopy for the array-backed stores
+    frozen = copy.deepcopy(agent, {id(agent.value): agent.value.copy()})
+    return frozen
+
+
+def policy_fn(agent):
+    """
+    The agent's (epsilon-greedy) policy as a function
+    :param agent: agent to evaluate. agents without an epsilon attribute are treated as greedy
+    :return: function board -> {move: probability of playing it}
+    """
+    epsilon = getattr(agent, "epsilon", 0)
+
+    def policy(board):
+        legals = board.get_legals()
+        probs = {move: epsilon / len(legals) for move in legals}
+        if epsilon < 1:
+            agent.new_game(board.copy())
+            best = int(agent.get_best_move())
+            probs[best] += 1 - epsilon
+        return probs
+
+    return policy
+
+
+def outcome_probs(agent1, agent2, startermove=None, track=None):
+    """
+    Exact probability of each outcome of a game between two agents.
+    Positions are memoized by their exact encoding, not up to symmetry: a greedy agent breaks ties between equal
+    moves by position, so two symmetric boards aren't guaranteed to lead to symmetric games.
+    Afterstates an agent has never seen are initialized the same way they would be in play (usually randomly),
+    on a copy of the agent, so the result is only exact for the values the agents already have.
+    :param agent1: agent playing X
+    :param agent2: agent playing O
+    :param startermove: optional fixed first move for X (1-9)
+    :param track: optional (player, set). the code of every afterstate that player reaches is added to the set
+    :return: array of probabilities, indexed by GameStatus: [draw, X wins, O wins]
+    """
+    policies = {1: policy_fn(_frozen(agent1)), 2: policy_fn(_frozen(agent2))}
+    memo = {}  # board code: outcome probabilities from that position
+
+    def walk(board, player, moves=None):
+        if moves is None and board.code in memo:
+            return memo[board.code]
+        probs = np.zeros(3)
+        for move, p in (moves or policies[player](board)).items():
+            if p == 0:
+                continue
+            child = board.copy()
+            status = child.play_move(move, player)
+            if track is not None and track[0] == player:
+                track[1].add(child.code)
+            if status == GameStatus.RUNNING:
+                probs += p * walk(child, 3 - player)
+            else:
+                probs[status] += p
+        if moves is None:
+            memo[board.code] = probs
+        return probs
+
+    return walk(Board(), 1, None if startermove is None else {startermove: 1.0})
+
+
+def rmse(value, codes, optimal):
+    """
+    :param value: value fn to check
+    :param codes: board codes of the states to check. states value hasn't seen are skipped
+    :param optimal: ArrayValue of optimal values (DPSolver.optimal_value_fn())
+    :return: (RMSE over the states value has seen, number of states value hasn't seen)
+    """
+    sq_error = 0
+    seen = 0
+    for code in codes:
+        board = Board.from_code(code)
+        if board in value:
+            sq_error += (value[board] - optimal.table[CANON_ID[code]]) ** 2
+            seen += 1
+    return (np.sqrt(sq_error / seen) if seen else np.nan), len(codes) - seen
+
+
+def evaluate(agent, opponent, optimal=None):
+    """
+    Exact win/draw/loss rates of agent against opponent for each opener, and the RMSE of agent's values
+    against the optimal values over every afterstate agent can reach in those games
+    :param agent: agent to evaluate. plays X if agent.player_id == 1, else O
+    :param opponent: agent playing the other side
+    :param optimal: optimal ArrayValue. defaults to DPSolver.optimal_value_fn(agent.gamma)
+    :return: dict with {opener name: [P(win), P(draw), P(loss)]} for each of OPENERS, plus "rmse" and "unseen"
+    """
+    if optimal is None:
+        optimal = DPSolver.optimal_value_fn(agent.gamma)
+    x, o = (agent, opponent) if agent.player_id == 1 else (opponent, agent)
+    win, loss = (GameStatus.P1_WIN, GameStatus.P2_WIN) if agent.player_id == 1 else (GameStatus.P2_WIN, GameStatus.P1_WIN)
+
+    reached = set()
+    results = {}
+    for name, startermove in OPENERS.items():
+        probs = outcome_probs(x, o, startermove, track=(agent.player_id, reached))
+        results[name] = [probs[win], probs[GameStatus.DRAW], probs[loss]]
+    results["rmse"], results["unseen"] = rmse(agent.value, reached, optimal)
+    return results
+
+
+def random_agent(player_id):
+    return EpsilonAgent(player_id, epsilon=1)
+
+
+def optimal_agent(player_id, optimal=None):
+    return EpsilonAgent(player_id, epsilon=0, value=DPSolver.optimal_value_fn() if optimal is None else optimal)
+
+
+def print_evaluation(name, results):
+    print(f"{name}:\n"
+          f"          W     D     L")
+    for opener in OPENERS:
+        w, d, l = results[opener]
+        print(f"{opener:7s} {w:.3f} {d:.3f} {l:.3f}")
+    print(f"RMSE {results['rmse']:.3f} over reached states ({results['unseen']} reached states unseen)\n")
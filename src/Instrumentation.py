@@ -0,0 +1,174 @@
+"""
+Cheap timers and counters for the training loop, so a slow run can say where its time went.
+"""
+from collections.abc import Mapping
+import cProfile
+import io
+import json
+import pstats
+import time
+
+
+class _Phase:
+    """
+    Context manager which adds the time spent inside it to a running total
+    """
+    __slots__ = ("totals", "name", "start")
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.totals[self.name] = self.totals.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class TrainingMonitor:
+    """
+    Tracks per-phase time, throughput, value table sizes and value fn hit/miss counts during training,
+    and writes them out as one JSON line every `every` games.
+
+    usage:
+        monitor = TrainingMonitor((p1, p2), "metrics.jsonl")
+        for each game:
+            with monitor.phase("play"):
+                ...
+            with monitor.phase("train"):
+                ...
+            monitor.game_done(len(game_log))
+        monitor.close()
+    """
+    def __init__(self, agents, log_path=None, every=1000, profile_start=0, profile_games=0, profile_path=None):
+        """
+        :param agents: agents being trained. their value table sizes and hit/miss counts are reported
+        :param log_path: file to append JSON lines to. None to only keep the latest report in self.last_report
+        :param every: report every this many games
+        :param profile_start: game number to switch cProfile on at
+        :param profile_games: number of games to profile for. 0 to never profile
+        :param profile_path: where to dump the profile's pstats. the top functions are printed either way
+        """
+        self.agents = agents
+        self.every = every
+        self.log_file = open(log_path, "a") if log_path is not None else None
+        self.phases = {}  # phase name: total seconds
+        self.last_report = None
+
+        self.games = 0
+        self.states = 0  # afterstates trained on
+        self.start_time = time.perf_counter()
+        self._window_start = (self.start_time, 0, 0)  # (time, games, states) at the last report
+
+        self.profile_start = profile_start
+        self.profile_end = profile_start + profile_games
+        self.profile_path = profile_path
+        self._profiler = None
+        if profile_games and profile_start == 0:
+            self._start_profile()
+
+    def phase(self, name):
+        """
+        :return: context manager timing a phase of the training loop, e.g. with monitor.phase("train"): ...
+        """
+        return _Phase(self.phases, name)
+
+    def game_done(self, n_states):
+        """
+        Count a finished game. Reports every `every` games, and starts/stops the profiler at the window edges
+        :param n_states: number of afterstates in the game
+        """
+        self.games += 1
+        self.states += n_states
+        if self._profiler is None and self.games == self.profile_start and self.profile_end > self.profile_start:
+            self._start_profile()
+        elif self._profiler is not None and self.games == self.profile_end:
+            self._stop_profile()
+        if self.games % self.every == 0:
+            self.report()
+
+    def report(self):
+        """
+        Write a JSON line with the stats since the start and since the last report
+        :return: the report, as a dict
+        """
+        now = time.perf_counter()
+        window_time, window_games, window_states = self._window_start
+        window = max(now - window_time, 1e-9)
+        elapsed = now - self.start_time
+        hits = sum(getattr(agent, "value_hits", 0) for agent in self.agents)
+        misses = sum(getattr(agent, "value_misses", 0) for agent in self.agents)
+
+        report = {
+            "games": self.games,
+            "elapsed": elapsed,
+            "games_per_sec": (self.games - window_games) / window,
+            "states_per_sec": (self.states - window_states) / window,
+            "phases": dict(self.phases),
+            "phase_share": {name: t / elapsed for name, t in self.phases.items()} if elapsed > 0 else {},
+            # states in each value fn. None for value fns which don't keep states (e.g. NTupleValue)
+            "table_sizes": [len(agent.value) if isinstance(agent.value, Mapping) else None for agent in self.agents],
+            "value_hits": hits,
+            "value_misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+        if self.log_file is not None:
+            self.log_file.write(json.dumps(report) + "\n")
+            self.log_file.flush()
+        self.last_report = report
+        self._window_start = (now, self.games, self.states)
+        return report
+
+    def state(self):
+        """
+        :return: counters and log position, for resuming a run with restore()
+        """
+        if self.log_file is not None:
+            self.log_file.flush()
+        return {
+            "games": self.games,
+            "states": self.states,
+            "phases": dict(self.phases),
+            "elapsed": time.perf_counter() - self.start_time,
+            "log_offset": self.log_file.tell() if self.log_file is not None else None,
+        }
+
+    def restore(self, state):
+        """
+        Carry on from state(), dropping anything logged after it was taken
+        """
+        self.games = state["games"]
+        self.states = state["states"]
+        self.phases = dict(state["phases"])
+        now = time.perf_counter()
+        self.start_time = now - state["elapsed"]
+        self._window_start = (now, self.games, self.states)
+        if self.log_file is not None and state["log_offset"] is not None:
+            self.log_file.truncate(state["log_offset"])
+
+    def _start_profile(self):
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def _stop_profile(self):
+        self._profiler.disable()
+        if self.profile_path is not None:
+            self._profiler.dump_stats(self.profile_path)
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(20)
+        print(f"profile of games {self.profile_start}-{self.profile_end}:")
+        print(out.getvalue())
+        self._profiler = None
+
+    def close(self):
+        """
+        Stop any running profile and close the log file. Safe to call more than once
+        """
+        if self._profiler is not None:
+            self._stop_profile()
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
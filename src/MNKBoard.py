@@ -0,0 +1,268 @@
+"""
+Tic Tac Toe on bigger boards: m,n,k-games, where players need k in a row on a rows x cols board.
+"""
+from TicTacToe import GameStatus
+import numpy as np
+import random
+
+
+class _Geometry:
+    """
+    Everything about a rows x cols board with k in a row to win that can be worked out up front
+    """
+    def __init__(self, rows, cols, k):
+        self.rows, self.cols, self.k = rows, cols, k
+        self.n = rows * cols
+        self.full = (1 << self.n) - 1
+
+        # grid[r][c] is the bit index of the square at row r (from the top), col c. bit 0 is the bottom left square
+        grid = np.array([[(rows - 1 - r) * cols + c for c in range(cols)] for r in range(rows)])
+        self.grid = grid
+
+        # every line of k squares as a bitmask, and the lines through each square
+        lines = []
+        for r in range(rows):
+            for c in range(cols):
+                for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                    end_r, end_c = r + dr * (k - 1), c + dc * (k - 1)
+                    if 0 <= end_r < rows and 0 <= end_c < cols:
+                        lines.append(sum(1 << int(grid[r + dr * j, c + dc * j]) for j in range(k)))
+        self.lines = tuple(lines)
+        self.lines_through = tuple(tuple(line for line in lines if line & (1 << i)) for i in range(self.n))
+
+        # symmetries of the board as permutations of bit indices. perm[i] is the square which gets moved onto square i
+        transforms = [grid, np.rot90(grid, 2), np.flipud(grid), np.fliplr(grid)]
+        if rows == cols:
+            transforms += [np.rot90(grid), np.rot90(grid, 3), grid.T, grid[::-1, ::-1].T]
+        self.symmetries = []
+        for t in transforms:
+            perm = [0] * self.n
+            for dest, src in zip(grid.flat, t.flat):
+                perm[dest] = int(src)
+            self.symmetries.append(tuple(perm))
+
+        # inverses[t][i] is the square that square i is moved onto by symmetry t
+        inverses = [[perm.index(i) for i in range(self.n)] for perm in self.symmetries]
+
+        # apply a symmetry to a bitboard 8 bits at a time: _chunks[t][j][byte] is where byte j's bits end up
+        self._chunks = tuple(
+            tuple(
+                tuple(sum(1 << inverse[8 * j + b] for b in range(8) if byte & (1 << b) and 8 * j + b < self.n)
+                      for byte in range(256))
+                for j in range(-(-self.n // 8))
+            )
+            for inverse in inverses
+        )
+
+        # Zobrist keys. each board keeps one hash per symmetry, which is the hash of the transformed board.
+        # keys[player-1][i][t] gets XORed into hash t when player plays on square i
+        rng = random.Random(f"{rows},{cols},{k}")
+        z = [[rng.getrandbits(64) for _ in range(self.n)] for _ in range(2)]
+        self.keys = tuple(
+            tuple(tuple(z[p][inverse[i]] for inverse in inverses) for i in range(self.n))
+            for p in range(2)
+        )
+
+    def transform(self, mask, t):
+        """
+        :return: mask with symmetry t applied
+        """
+        out = 0
+        for j, table in enumerate(self._chunks[t]):
+            out |= table[(mask >> (8 * j)) & 255]
+        return out
+
+
+_GEOMETRIES = {}
+
+
+def _geometry(rows, cols, k):
+    if (rows, cols, k) not in _GEOMETRIES:
+        _GEOMETRIES[rows, cols, k] = _Geometry(rows, cols, k)
+    return _GEOMETRIES[rows, cols, k]
+
+
+class MNKBoard:
+    """
+    Smart game board for m,n,k games, with the same interface as TicTacToe.Board.
+    Positions are numbered like a numpad: 1 is the bottom left square, counting left to right then bottom to top.
+    Hashing is incremental (Zobrist), and equality is up to the symmetries of the board.
+    """
+    __slots__ = ("geometry", "x", "o", "hashes")
+
+    def __init__(self, rows=3, cols=3, k=3):
+        """
+        :param rows: number of rows
+        :param cols: number of columns
+        :param k: number in a row needed to win
+        """
+        self.geometry = _geometry(rows, cols, k)
+        self.x = 0  # squares held by player1=X
+        self.o = 0  # squares held by player2=O
+        self.hashes = (0,) * len(self.geometry.symmetries)  # hash of each transformation of the board
+
+    @staticmethod
+    def from_string(init_string, k=None):
+        """
+        Recover the game board from a string. from_string(str(board), board.geometry.k) should do nothing
+        :param init_string:
+        :param k: number in a row needed to win. defaults to the shorter side of the board
+        :return: MNKBoard specified by the string
+        """
+        rows = [line.split("|") for line in init_string.splitlines()[::2]]
+        board = MNKBoard(len(rows), len(rows[0]), k if k is not None else min(len(rows), len(rows[0])))
+        for r, row in enumerate(rows):
+            for c, cell in enumerate(row):
+                pos = int(board.geometry.grid[r, c]) + 1
+                if cell.strip() == "X":
+                    board.play_move(pos, 1)
+                elif cell.strip() == "O":
+                    board.play_move(pos, 2)
+        return board
+
+    def play_move(self, pos, player):
+        """
+        player `player` played on square `pos`
+        only the lines through `pos` are checked for a win, since any other line was already checked
+        :param pos: # from 1 to rows*cols
+        :param player: 1 for p1, 2 for p2
+        :return: GameStatus after the move
+        """
+        assert (1 <= pos <= self.geometry.n)
+        assert (player in [1,2])
+
+        i = int(pos) - 1
+        if player == 1:
+            self.x |= 1 << i
+            mine = self.x
+        else:
+            self.o |= 1 << i
+            mine = self.o
+        self.hashes = tuple(h ^ key for h, key in zip(self.hashes, self.geometry.keys[player - 1][i]))
+
+        for line in self.geometry.lines_through[i]:
+            if mine & line == line:
+                return player
+
+        if self.x | self.o == self.geometry.full:
+            return GameStatus.DRAW
+        return GameStatus.RUNNING
+
+    def sim_move(self, pos, player):
+        """
+        Simulate a move by creating a copy of self and playing the move on that.
+        :return: An instance of MNKBoard where the move has been played
+        """
+        sim_board = self.copy()
+        sim_board.play_move(pos, player)
+        return sim_board
+
+    def running_state(self):
+        """
+        returns id of winning player (1 or 2) if someone has won
+        returns GameStatus.DRAW or GameStatus.RUNNING if nobody has won
+        """
+        x, o = self.x, self.o
+        for line in self.geometry.lines:
+            if x & line == line:
+                return GameStatus.P1_WIN
+            if o & line == line:
+                return GameStatus.P2_WIN
+
+        if x | o == self.geometry.full:
+            return GameStatus.DRAW
+        return GameStatus.RUNNING
+
+    def get_legals(self):
+        """
+        :return: list of free positions
+        """
+        free = self.geometry.full & ~(self.x | self.o)
+        legals = []
+        while free:
+            low = free & -free
+            legals.append(low.bit_length())
+            free ^= low
+        return legals
+
+    def get_flat(self):
+        """
+        :return: "flat" representation of the board, where index 0 is position 1
+        """
+        x, o = self.x, self.o
+        return np.array([1 if x >> i & 1 else 2 if o >> i & 1 else 0 for i in range(self.geometry.n)])
+
+    @property
+    def board(self):
+        """
+        rows x cols numpy array, where 0=free, 1=X, 2=O
+        """
+        return self.get_flat()[self.geometry.grid]
+
+    def equivs(self):
+        """
+        Generate all NUMPY boards which are equivalent to board
+        """
+        flat = self.get_flat()
+        return [flat[np.array(perm)][self.geometry.grid] for perm in self.geometry.symmetries]
+
+    def copy(self):
+        board = MNKBoard.__new__(MNKBoard)
+        board.geometry = self.geometry
+        board.x = self.x
+        board.o = self.o
+        board.hashes = self.hashes
+        return board
+
+    def __repr__(self):
+        XO = [" ", "X", "O"]
+        flat = self.get_flat()
+        rows = [" | ".join(XO[flat[i]] for i in row) for row in self.geometry.grid]
+        return f"\n{'-' * (4 * self.geometry.cols - 3)}\n".join(rows)
+
+    def _canonical_bits(self):
+        """
+        bitboards of the transformation with the smallest hash
+        """
+        t = self.hashes.index(min(self.hashes))
+        return self.geometry.transform(self.x, t), self.geometry.transform(self.o, t)
+
+    def __hash__(self):
+        """
+        smallest hash of any transformation of the board, so equivalent boards hash the same
+        """
+        return min(self.hashes)
+
+    def __eq__(self, other):
+        """
+        check equality, up to rotational and reflection symmetry
+        """
+        if not isinstance(other, MNKBoard):
+            return NotImplemented
+        return (
+            self.geometry is other.geometry
+            and min(self.hashes) == min(other.hashes)
+            and self._canonical_bits() == other._canonical_bits()
+        )
+
+    def __len__(self):
+        return bin(self.x | self.o).count("1")
+
+
+if __name__ == "__main__":
+    """
+    Train TD(0) agents on a 4x4 board with 3 in a row, and report games/sec
+    """
+    from Agent import TDAgent, play_match
+    import time
+
+    rewards = {GameStatus.DRAW: 0, GameStatus.P1_WIN: 1, GameStatus.P2_WIN: -1}
+    p1 = TDAgent(1)
+    p2 = TDAgent(2)
+    n = 5000
+    start = time.perf_counter()
+    for _ in range(n):
+        outcome, game_log = play_match(p1, p2, board=MNKBoard(4, 4, 3))
+        p1.train(game_log[::2], rewards[outcome])
+        p2.train(game_log[1::2], rewards[outcome])
+    print(f"{n / (time.perf_counter() - start):.0f} games/sec, {len(p1.value) + len(p2.value)} states seen")
@@ -0,0 +1,135 @@
+"""
+Compact append-only log of training metrics: the outcome and opener of every game, and the value of each
+opening move every so often. Training appends to it, and Plotter.py renders it from another process.
+
+File layout: header (magic, version, record size), then one fixed-size RECORD per game.
+"""
+from TicTacToe import Board
+import numpy as np
+import os
+import struct
+
+MAGIC = b"TTTMETRC"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")  # magic, version, record size
+
+# one record per game. values holds the value of each opening move, or NaN on games where it wasn't recorded
+RECORD = np.dtype([("outcome", "u1"), ("opener", "u1"), ("pad", "u2"), ("values", "<f4", (3,))])
+
+OPENER_LABELS = ("Corner", "Side", "Centre")
+OPENER_SQUARES = (9, 6, 5)  # square played for each opener when looking up its value
+
+
+class MetricsWriter:
+    """
+    Buffers game records in memory and appends them to the log in blocks, so logging a game is just a few
+    list appends
+    """
+    def __init__(self, rpath, agent, value_every=100, buffer_games=1000):
+        """
+        :param rpath: log file. appended to if it already exists
+        :param agent: agent whose value fn the opener values are read from (normally p1)
+        :param value_every: record the opener values every this many games
+        :param buffer_games: write to disk every this many games
+        """
+        self.rpath = rpath
+        self.agent = agent
+        self.value_every = value_every
+        self.buffer_games = buffer_games
+        self.openers = []
+        for square in OPENER_SQUARES:
+            board = Board()
+            board.play_move(square, 1)
+            self.openers.append(board)
+
+        self.f = open(rpath, "ab")
+        if self.f.tell() == 0:
+            self.f.write(_HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+            self.games = 0
+        else:
+            self.games = _record_count(rpath)  # carry on from the games already in the log
+
+        self._outcomes = []
+        self._openers = []
+        self._values = {}  # index in buffer: opener values
+
+    def log(self, outcome, opener):
+        """
+        record the outcome of a game
+        :param outcome: GameStatus of the finished game
+        :param opener: opening move label, one of OPENER_LABELS
+        """
+        self._outcomes.append(outcome)
+        self._openers.append(OPENER_LABELS.index(opener))
+        self.games += 1
+        if self.games % self.value_every == 0:
+            value = self.agent.value
+            self._values[len(self._outcomes) - 1] = [value.get(board, np.nan) for board in self.openers]
+        if len(self._outcomes) >= self.buffer_games:
+            self.flush()
+
+    def flush(self):
+        """
+        append the buffered records to the log
+        """
+        if not self._outcomes:
+            return
+        records = np.zeros(len(self._outcomes), dtype=RECORD)
+        records["outcome"] = self._outcomes
+        records["opener"] = self._openers
+        records["values"] = np.nan
+        for i, values in self._values.items():
+            records["values"][i] = values
+        self.f.write(records.tobytes())
+        self.f.flush()
+        self._outcomes, self._openers, self._values = [], [], {}
+
+    def close(self):
+        """
+        write anything still buffered and close the file. Safe to call more than once
+        """
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _record_count(rpath):
+    """
+    :return: number of complete records in the log. a record still being written is ignored
+    """
+    return max(os.path.getsize(rpath) - _HEADER.size, 0) // RECORD.itemsize
+
+
+def truncate(rpath, n_records):
+    """
+    Cut a log back to its first n_records records, e.g. to drop games logged after a checkpoint
+    """
+    if os.path.exists(rpath):
+        with open(rpath, "r+b") as f:
+            f.truncate(_HEADER.size + n_records * RECORD.itemsize)
+
+
+def read(rpath, start=0):
+    """
+    Read records from a log, which may still be being written to
+    :param rpath: log file
+    :param start: index of the first record to read
+    :return: array of RECORD, from record `start` to the last complete record
+    """
+    with open(rpath, "rb") as f:
+        magic, version, record_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{rpath} is not a metrics log")
+        if version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"{rpath} has unsupported version {version} (record size {record_size})")
+        count = _record_count(rpath) - start
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD)
+        f.seek(_HEADER.size + start * RECORD.itemsize)
+        return np.frombuffer(f.read(count * RECORD.itemsize), dtype=RECORD)
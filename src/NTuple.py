@@ -0,0 +1,120 @@
+"""
+Fixed-size value functions for boards too big to keep a value for every state.
+"""
+from TicTacToe import LINES
+import numpy as np
+import os
+
+EXTENSION = ".npz"  # networks are saved as numpy .npz archives
+
+
+def npz_path(rpath):
+    """
+    :return: rpath with its suffix swapped for EXTENSION, which is where a network saved "to rpath" goes
+    """
+    root, ext = os.path.splitext(rpath)
+    return rpath if ext == EXTENSION else root + EXTENSION
+
+
+class NTupleValue:
+    """
+    Value function approximated by an n-tuple network.
+    The network is a fixed set of tuples of squares. Each tuple has a table of weights, indexed by what's on its
+    squares, and the value of a board is the sum of the weights it picks out. Memory is set by the tuples, and doesn't
+    grow with the number of states visited.
+    Acts like the agents' {Board: float} dict: every board has a value, and setting a board's value moves the
+    weights it uses just enough that the board's value becomes exactly that (a sparse update).
+    Works with any board with a get_flat() method, e.g. TicTacToe.Board or MNKBoard.
+    """
+
+    def __init__(self, tuples, n_squares):
+        """
+        :param tuples: list of tuples of squares (bit indices, i.e. position-1)
+        :param n_squares: number of squares on the board
+        """
+        self.tuples = [tuple(t) for t in tuples]
+        sizes = [3 ** len(t) for t in self.tuples]
+        self.offsets = np.cumsum([0] + sizes[:-1])  # start of each tuple's weights
+        self.weights = np.zeros(sum(sizes))
+
+        # powers[i, j] is how much an X on square i adds to tuple j's index (O adds double). 0 if i isn't in tuple j
+        self.powers = np.zeros((n_squares, len(self.tuples)), dtype=np.int64)
+        for j, t in enumerate(self.tuples):
+            for place, square in enumerate(t):
+                self.powers[square, j] = 3 ** place
+
+    @staticmethod
+    def lines(board):
+        """
+        Network with one tuple for every winning line of board
+        :param board: TicTacToe.Board or MNKBoard
+        """
+        lines = board.geometry.lines if hasattr(board, "geometry") else LINES
+        n_squares = len(board.get_flat())
+        return NTupleValue([[i for i in range(n_squares) if line >> i & 1] for line in lines], n_squares)
+
+    def _indices(self, board):
+        """
+        :return: index into self.weights picked out by each tuple
+        """
+        return board.get_flat() @ self.powers + self.offsets
+
+    def move_values(self, board, init=None):
+        """
+        Value of the afterstate of every legal move, with one gather-sum over the weights
+        :param board: board to move on
+        :param init: unused. every board already has a value
+        :return: (array of legal moves, array of their afterstate values)
+        """
+        player = 1 if len(board) % 2 == 0 else 2
+        moves = np.asarray(board.get_legals())
+        indices = self._indices(board) + player * self.powers[moves - 1]
+        return moves, self.weights[indices].sum(axis=1)
+
+    def copy(self):
+        other = NTupleValue.__new__(NTupleValue)
+        other.tuples = self.tuples
+        other.offsets = self.offsets
+        other.powers = self.powers
+        other.weights = self.weights.copy()
+        return other
+
+    def clear(self):
+        self.weights[:] = 0
+
+    def get(self, board, default=None):
+        return self[board]
+
+    def save(self, rpath):
+        """
+        Save the network to a .npz file at exactly rpath. agents only load networks from paths ending in EXTENSION
+        """
+        with open(rpath, "wb") as f:
+            np.savez(f, weights=self.weights, powers=self.powers, offsets=self.offsets,
+                     tuples=np.array([list(t) + [-1] * (self.powers.shape[0] - len(t)) for t in self.tuples]))
+
+    @staticmethod
+    def load(rpath):
+        """
+        Load a network written by save()
+        """
+        with np.load(rpath) as data:
+            value = NTupleValue([[i for i in t if i >= 0] for t in data["tuples"].tolist()], data["powers"].shape[0])
+            value.weights[:] = data["weights"]
+        return value
+
+    def __getitem__(self, board):
+        return float(self.weights[self._indices(board)].sum())
+
+    def __setitem__(self, board, value):
+        indices = self._indices(board)
+        self.weights[indices] += (value - self.weights[indices].sum()) / len(indices)
+
+    def __contains__(self, board):
+        return True
+
+    def __len__(self):
+        """
+        number of weights, which is all the network ever stores
+        """
+        return len(self.weights)
@@ -1,16 +1,105 @@
 """
-For plotting fun stuff with MonteCarlo Agents
+For plotting fun stuff with MonteCarlo Agents.
+Renders the metrics log written during training (see MetricsLog.py), in its own process so training never waits on it:
+
+    python Plotter.py metrics.log            # render the log once, saving the figures as .png
+    python Plotter.py metrics.log --follow   # keep re-rendering as training appends to the log
+    python Plotter.py metrics.log --show     # show the figures in a window too
 """
 import matplotlib.pyplot as plt
-from TicTacToe import Board
+import MetricsLog
 import numpy as np
 from collections import namedtuple
+import argparse
+import os
+import time
 
 Data = namedtuple("Data", ["data", "colour", "label"])
 
 
+class History:
+    """
+    History of one plotted series in a fixed number of points, however long it gets.
+    Samples are grouped into buckets which keep their min and max. When the buffer fills up, neighbouring buckets
+    are merged and each bucket covers twice as many samples, so spikes survive and redraw cost stays flat.
+    """
+    def __init__(self, budget=1000):
+        """
+        :param budget: max number of buckets kept. each bucket is drawn as 2 points (its min and max)
+        """
+        self.budget = budget + budget % 2  # even, so buckets always merge in pairs
+        self.x = np.zeros(self.budget)  # x of the first sample in each bucket
+        self.lo = np.zeros(self.budget)  # min of each bucket
+        self.hi = np.zeros(self.budget)  # max of each bucket
+        self.n = 0  # number of full buckets
+        self.stride = 1  # samples per bucket
+        self.samples = 0  # samples seen
+        self._partial = None  # [x, lo, hi, count] of the bucket being filled
+
+    def append(self, y):
+        if self._partial is None:
+            self._partial = [self.samples, y, y, 0]
+        partial = self._partial
+        partial[1] = min(partial[1], y)
+        partial[2] = max(partial[2], y)
+        partial[3] += 1
+        self.samples += 1
+        if partial[3] == self.stride:
+            self.x[self.n], self.lo[self.n], self.hi[self.n] = partial[:3]
+            self.n += 1
+            self._partial = None
+            if self.n == self.budget:
+                self._merge()
+
+    def _merge(self):
+        # halve the number of buckets by merging neighbours
+        half = self.n // 2
+        self.x[:half] = self.x[0::2]
+        self.lo[:half] = np.minimum(self.lo[0::2], self.lo[1::2])
+        self.hi[:half] = np.maximum(self.hi[0::2], self.hi[1::2])
+        self.n = half
+        self.stride *= 2
+
+    def points(self):
+        """
+        :return: (x, y) to draw, with each bucket's min and max as consecutive points
+        """
+        x, lo, hi = self.x[:self.n], self.lo[:self.n], self.hi[:self.n]
+        if self._partial is not None:
+            x = np.append(x, self._partial[0])
+            lo = np.append(lo, self._partial[1])
+            hi = np.append(hi, self._partial[2])
+        return np.repeat(x, 2), np.column_stack((lo, hi)).ravel()
+
+
+class Last100:
+    """
+    Rate of each outcome over the last 100 games, kept as running counts over a ring buffer
+    """
+    def __init__(self):
+        self.buffer = np.zeros(100, dtype=np.int8)  # starts as 100 draws
+        self.counts = np.array([100, 0, 0])  # number of draws, p1 wins, p2 wins in the buffer
+        self.pos = 0
+
+    def append(self, outcome):
+        self.counts[self.buffer[self.pos]] -= 1
+        self.counts[outcome] += 1
+        self.buffer[self.pos] = outcome
+        self.pos = (self.pos + 1) % 100
+
+    def rates(self):
+        return self.counts / 100
+
+
 class Plotter:
-    def __init__(self, p1, p2):
+    def __init__(self, show=False, out_dir=".", budget=1000):
+        """
+        :param show: draw the figures in interactive windows. Otherwise they're only saved, which works headless
+        :param out_dir: where to save the figures
+        :param budget: max points kept per plotted series
+        """
+        self.show = show
+        self.out_dir = out_dir
         self.plt_init()
         # select plots
         self.plot_openers = True
@@ -19,21 +108,8 @@ class Plotter:
         self.plot_last100 = True
         self.plot_open100 = True
 
-        # objects
-        self.p1 = p1
-        self.p2 = p2
-
-        # opening moves (used to index into value fn to track values)
-        corner = Board()
-        corner.play_move(9, 1)
-        side = Board()
-        side.play_move(6, 1)
-        centre = Board()
-        centre.play_move(5, 1)
-        self.openers = [corner, side, centre]
-
         outcome_labels = ["Draw", "P1 Win", "P2 Win"]
-        open_labels = ["Corner", "Side", "Centre"]
+        open_labels = list(MetricsLog.OPENER_LABELS)
         self.open_labels = open_labels
         outcome_colours = ["Red", "Green", "Blue"]
         open_colours = ["c", "m", "y"]
@@ -42,22 +118,29 @@ class Plotter:
         # outcome logs
         self.games_played = 0
         self.wins = [0, 0, 0]  # number of draws, p1_wins, p2_wins
-        self._last100 = {o: [0] * 100 for o in self.open_labels}  # buffer of last 100 games. organized by opening move
+        self._last100 = {o: Last100() for o in self.open_labels}  # last 100 games of each opening move
+
+        def series(colours, labels):
+            return [Data(History(budget), c, l) for c, l in zip(colours, labels)]
 
-        self.win_log = [Data([], c, l) for c, l in zip(outcome_colours, outcome_labels)]
-        self.winrates = [Data([], c, l) for c, l in zip(outcome_colours, outcome_labels)]  # history of winrate
-        self.last100wr = [Data([], c, l) for c, l in zip(outcome_colours, outcome_labels)]
+        self.win_log = series(outcome_colours, outcome_labels)
+        self.winrates = series(outcome_colours, outcome_labels)  # history of winrate
+        self.last100wr = series(outcome_colours, outcome_labels)
         # each opener gets a plot akin to last100wr
-        self.open100 = {o: [Data([], c, l) for c, l in zip(outcome_colours, outcome_labels)] for o in open_labels}
-        self.opener_value = [Data([], c, l) for c, l in zip(open_colours, open_labels)]
+        self.open100 = {o: series(outcome_colours, outcome_labels) for o in open_labels}
+        self.opener_value = series(open_colours, open_labels)
+        self.lines = {}  # id of each Data: its Line2D, updated in place by make_plots
 
         self.init_figures()
 
     def init_figures(self):
+        def add_lines(ax, dataset):
+            for data in dataset:
+                self.lines[id(data)], = ax.plot([], [], color=data.colour, label=data.label)
+
         def init_fig(dataset, title, xlabel):
             fig, ax = plt.subplots(figsize=(12,7))
-            for data in dataset:
-                ax.plot(data.data, color=data.colour, label=data.label)
+            add_lines(ax, dataset)
             ax.set_title(title)
             ax.set_xlabel(xlabel)
             ax.legend()
@@ -65,6 +148,12 @@ class Plotter:
             fig.canvas.flush_events()
             return fig, ax
 
+        def place_window(geometry):
+            # window placement only means anything with an interactive Tk backend
+            window = getattr(plt.get_current_fig_manager(), "window", None)
+            if hasattr(window, "wm_geometry"):
+                window.wm_geometry(geometry)
+
         if self.plot_wins:
             self.winfig, self.winax = init_fig(
                 self.win_log,
@@ -84,8 +173,7 @@ class Plotter:
                 "Outcome Rates (last 100 games)",
                 "Total Games Played (hundreds)"
             )
-            thismanager = plt.get_current_fig_manager()
-            thismanager.window.wm_geometry("+1200+0")
+            place_window("+1200+0")
 
         if self.plot_openers:
             self.openfig, self.openax = init_fig(
@@ -93,24 +181,26 @@ class Plotter:
                 "Opening Move Values",
                 "Total Games Played (hundreds)"
             )
-            thismanager = plt.get_current_fig_manager()
-            thismanager.window.wm_geometry("+1200+700")
+            place_window("+1200+700")
 
         if self.plot_open100:
             self.open100fig, self.open100axs = plt.subplots(3, 1, figsize=(12,20))
             for ax, (opener_name, dataset) in zip(self.open100axs, self.open100.items()):
-                for data in dataset:
-                    ax.plot(data.data, color=data.colour, label=data.label)
+                add_lines(ax, dataset)
                 ax.set_title(opener_name)
             self.open100fig.suptitle("Outcome Rates (last 100 games) by opening move")
             self.open100axs[2].set_xlabel("Total Games Played (hundreds)")
             self.open100axs[0].legend()
             self.open100fig.canvas.draw()
             self.open100fig.canvas.flush_events()
-            thismanager = plt.get_current_fig_manager()
-            thismanager.window.wm_geometry("+0+0")
+            place_window("+0+0")
 
     def plt_init(self):
+        if not self.show:
+            # headless: only ever save the figures
+            plt.switch_backend("Agg")
+            return
+
         # make pyplot print to external backend
         candidates = ["macosx", "qt5agg", "gtk3agg", "tkagg", "wxagg"]
         for candidate in candidates:
@@ -125,24 +215,27 @@ class Plotter:
         plt.ion()
 
     def current_winrates(self):
-        opener_winrates_100 = {}  # winrate over last 100 for each opener
-        collected_winrates_100 = np.zeros((3))
-        for open_str in self.open_labels:
-            outcomes_last_100 = np.array(self._last100[open_str])
-            rates_last_100 = [np.sum(outcomes_last_100==i)/100 for i in range(3)]
-            opener_winrates_100[open_str] = rates_last_100
-            collected_winrates_100 += rates_last_100
-        winrates_100 = collected_winrates_100/3
+        opener_winrates_100 = {o: self._last100[o].rates() for o in self.open_labels}  # winrate over last 100 for each opener
+        winrates_100 = sum(opener_winrates_100.values()) / 3
         winrates = [score / self.games_played for score in self.wins] if self.plot_winrates else None
         return winrates, winrates_100, opener_winrates_100
 
-    def log_and_plot(self, outcome, opener):
+    def add_records(self, records):
+        """
+        update trackers with game records read from the metrics log
+        :param records: array of MetricsLog.RECORD
+        """
+        for outcome, opener, values in zip(records["outcome"].tolist(), records["opener"].tolist(),
+                                           records["values"].tolist()):
+            self.log(outcome, self.open_labels[opener], values)
+
+    def log(self, outcome, opener, opener_values):
         """
         record the outcome of a game. update trackers
+        :param opener_values: value of each opening move, or NaNs if they weren't recorded for this game
         """
         self.games_played += 1
         self.wins[outcome] += 1
-        self._last100[opener].pop(0)
         self._last100[opener].append(outcome)
         # update logs every 100 games
         if self.games_played % 100 != 0:
@@ -162,39 +255,65 @@ class Plotter:
                 for open_str in self.open_labels:
                     self.open100[open_str][i].data.append(opener_wr100[open_str][i])
             if self.plot_openers:
-                move = self.openers[i]
-                value = self.p1.value[move]
-                self.opener_value[i].data.append(value)
-
-        if self.games_played % 1000 == 0:
-            self.make_plots()
+                self.opener_value[i].data.append(opener_values[i])
 
     def make_plots(self):
         def plot(fig, ax, dataset):
             for data in dataset:
-                ax.plot(data.data, color=data.colour, label=data.label)
-            fig.canvas.draw()
-            fig.canvas.flush_events()
+                self.lines[id(data)].set_data(*data.data.points())
+            ax.relim()
+            ax.autoscale_view()
+            if self.show:  # otherwise savefig does the drawing
+                fig.canvas.draw()
+                fig.canvas.flush_events()
+
+        def save(fig, name):
+            fig.savefig(os.path.join(self.out_dir, name))
 
         if self.plot_wins:
             plot(self.winfig, self.winax, self.win_log)
-            self.winfig.savefig("wins.png")
+            save(self.winfig, "wins.png")
 
         if self.plot_winrates:
             plot(self.wrfig, self.wrax, self.winrates)
-            self.wrfig.savefig("outcomes.png")
+            save(self.wrfig, "outcomes.png")
 
         if self.plot_last100:
             plot(self.last100fig, self.last100ax, self.last100wr)
-            self.last100fig.savefig("outcomes100.png")
+            save(self.last100fig, "outcomes100.png")
 
         if self.plot_openers:
             plot(self.openfig, self.openax, self.opener_value)
-            self.last100fig.savefig("openers.png")
+            save(self.openfig, "openers.png")
 
         if self.plot_open100:
             # self.open100 is structured like {opener_name: [Data*3]}
             for ax, dataset in zip(self.open100axs, self.open100.values()):
                 plot(self.open100fig, ax, dataset)
-            self.open100fig.savefig("open100.png")
+            save(self.open100fig, "open100.png")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot a training run from its metrics log")
+    parser.add_argument("log", help="metrics log written during training")
+    parser.add_argument("--follow", action="store_true", help="keep plotting new games as they're logged")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between checks for new games")
+    parser.add_argument("--show", action="store_true", help="show the figures in windows, not just save them")
+    parser.add_argument("--out", default=".", help="directory to save the figures in")
+    args = parser.parse_args()
 
+    plotter = Plotter(show=args.show, out_dir=args.out)
+    read = 0  # records plotted so far
+    while True:
+        records = MetricsLog.read(args.log, start=read)
+        if len(records):
+            read += len(records)
+            plotter.add_records(records)
+            plotter.make_plots()
+            print(f"plotted {read} games")
+        if not args.follow:
+            break
+        if args.show:
+            plt.pause(args.interval)
+        else:
+            time.sleep(args.interval)
@@ -0,0 +1,71 @@
+"""
+Seedable random numbers for the agents, drawn from a numpy Generator in big blocks.
+"""
+import numpy as np
+
+
+class RandomStream:
+    """
+    Stream of uniform random numbers in [0, 1), drawn from a numpy Generator `block` at a time.
+    Every draw an agent makes (exploration coin, random move, initial value) comes out of the next number in the
+    current block, which is just a list index, and the block is refilled with one Generator call when it runs out.
+    Streams are seeded with a numpy SeedSequence, so independent child streams can be made for each worker with spawn().
+    Pickling a stream (e.g. inside a pickled agent) saves exactly where it is, so a resumed run draws the same numbers.
+    """
+    def __init__(self, seed=None, block=4096):
+        """
+        :param seed: int, numpy SeedSequence, or None for a fresh seed from the OS
+        :param block: number of values drawn from the Generator at a time
+        """
+        self.seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seed_seq)
+        self.block = block
+        self._values = []  # current block, as a list so single draws are cheap
+        self._next = 0  # index of the next unused value in the block
+
+    @staticmethod
+    def of(rng):
+        """
+        :param rng: RandomStream, or anything RandomStream() takes as a seed
+        :return: rng if it's already a RandomStream, otherwise a new stream seeded with it
+        """
+        return rng if isinstance(rng, RandomStream) else RandomStream(rng)
+
+    def _refill(self):
+        self._values = self.generator.random(self.block).tolist()
+        self._next = 0
+
+    def random(self):
+        """
+        :return: next float in [0, 1)
+        """
+        if self._next == len(self._values):
+            self._refill()
+        u = self._values[self._next]
+        self._next += 1
+        return u
+
+    def choice(self, seq):
+        """
+        :return: uniformly random element of seq
+        """
+        return seq[int(self.random() * len(seq))]
+
+    def uniform(self, low, high, n):
+        """
+        :return: list of n floats uniformly distributed in [low, high)
+        """
+        if n > self.block:
+            return (low + (high - low) * self.generator.random(n)).tolist()
+        if self._next + n > len(self._values):
+            self._refill()  # whatever's left in the block is skipped
+        take = self._values[self._next:self._next + n]
+        self._next += n
+        scale = high - low
+        return [low + scale * u for u in take]
+
+    def spawn(self, n):
+        """
+        :return: list of n independent child streams, e.g. one for each worker process
+        """
+        return [RandomStream(child, self.block) for child in self.seed_seq.spawn(n)]
@@ -0,0 +1,123 @@
+"""
+Experience replay for TD agents: past games kept as compact arrays of afterstate codes, so they can be trained on again.
+"""
+import numpy as np
+
+
+class SumTree:
+    """
+    Binary tree where each node holds the sum of its children, over a fixed number of leaves.
+    Updating a leaf and sampling a leaf in proportion to its value are both O(log n)
+    """
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves)  # tree[1] is the root, tree[leaves + i] is leaf i
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        """
+        set leaves to new values, then fix up the sums above them one level at a time
+        :param indices: leaf indices
+        :param priorities: new value of each leaf
+        """
+        nodes = np.asarray(indices) + self.leaves
+        self.tree[nodes] = priorities
+        if len(nodes) == 1:
+            # single leaf (every add()): a plain loop is much cheaper than the array version
+            tree, node = self.tree, int(nodes[0]) // 2
+            while node:
+                tree[node] = tree[2 * node] + tree[2 * node + 1]
+                node //= 2
+            return
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, targets):
+        """
+        :param targets: values in [0, total())
+        :return: for each target, the leaf where the running sum of leaves passes it
+        """
+        nodes = np.ones(len(targets), dtype=np.int64)
+        targets = np.array(targets, dtype=np.float64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = targets >= self.tree[left]
+            targets -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class ReplayBuffer:
+    """
+    Ring buffer of past games, sampled uniformly or in proportion to their TD error.
+    Each game is one player's afterstate codes (like Trajectory.afterstates()) and the game's reward
+    """
+    def __init__(self, capacity=10_000, max_length=5, prioritized=False, priority_exponent=0.6, min_priority=1e-3):
+        """
+        :param capacity: number of games kept. the oldest are overwritten once it's full
+        :param max_length: most afterstates one player can have in a game (5 for X on a 3x3 board)
+        :param prioritized: sample games in proportion to (TD error + min_priority) ** priority_exponent
+        :param priority_exponent: 0 is uniform sampling, 1 is fully in proportion to TD error
+        :param min_priority: added to every TD error, so no game is never replayed
+        """
+        self.capacity = capacity
+        self.codes = np.full((capacity, max_length), -1, dtype=np.int32)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity)
+        self.prioritized = prioritized
+        self.priority_exponent = priority_exponent
+        self.min_priority = min_priority
+        self.tree = SumTree(capacity) if prioritized else None
+
+        self.next = 0  # slot the next game goes in
+        self.size = 0  # number of games stored
+
+    def __len__(self):
+        return self.size
+
+    def _priority(self, errors):
+        return (np.abs(errors) + self.min_priority) ** self.priority_exponent
+
+    def add(self, codes, reward, error=0.0):
+        """
+        store a game
+        :param codes: afterstate codes of the game
+        :param reward: reward of the game
+        :param error: TD error of the game, for prioritized sampling
+        """
+        i = self.next
+        self.codes[i] = -1
+        self.codes[i, :len(codes)] = codes
+        self.lengths[i] = len(codes)
+        self.rewards[i] = reward
+        if self.tree is not None:
+            self.tree.update([i], self._priority(error))
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, n, rng=None):
+        """
+        :param n: number of games to sample (with replacement)
+        :param rng: optional numpy Generator, e.g. the generator of the agent's RandomStream
+        :return: (slots of the sampled games, their codes, lengths, rewards)
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        if self.tree is not None:
+            slots = self.tree.find(rng.random(n) * self.tree.total())
+            slots = np.minimum(slots, self.size - 1)  # guard against rounding at the very end of the tree
+        else:
+            slots = rng.integers(0, self.size, n)
+        return slots, self.codes[slots], self.lengths[slots], self.rewards[slots]
+
+    def update_priorities(self, slots, errors):
+        """
+        :param slots: slots returned by sample()
+        :param errors: new TD error of each of those games
+        """
+        if self.tree is not None:
+            self.tree.update(slots, self._priority(np.asarray(errors)))
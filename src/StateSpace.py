@@ -0,0 +1,101 @@
+"""
+The graph of every reachable Tic Tac Toe position (up to symmetry) and its transitions.
+Built once, saved to disk, and shared by the agents, the solver and anything else that needs to walk the game.
+"""
+from TicTacToe import GameStatus, DIGITS, POW3, CANON_ID, CANON_SYM, STATUS, N_CODES, SYMMETRIES
+import numpy as np
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# INV_SYMMETRIES[t][j] is the square that square j is moved onto by symmetry t
+INV_SYMMETRIES = np.argsort(np.array(SYMMETRIES), axis=1)
+
+
+class StateSpace:
+    """
+    Every reachable position, stored by canonical id (Board.canonical_id()) and ordered by ply.
+    Moves are in the canonical position's orientation. move_afterstates() converts to a board's own orientation.
+    """
+    def __init__(self, ids, afterstates):
+        """
+        :param ids: canonical id of every reachable position
+        :param afterstates: (len(ids), 9) array with the canonical id of the afterstate of each move (square 1-9),
+                            or -1 where the move is illegal or the game is over
+        """
+        self.ids = ids
+        self.afterstates = afterstates
+        self.status = STATUS[ids]  # GameStatus of each position
+        self.terminal = self.status != GameStatus.RUNNING
+        self.winner = np.where((self.status == GameStatus.P1_WIN) | (self.status == GameStatus.P2_WIN), self.status, 0)
+        self.ply = np.count_nonzero(DIGITS[ids], axis=1)  # number of moves played
+        self.to_move = (self.ply % 2) + 1  # 1 for X, 2 for O
+        self.index = np.full(N_CODES, -1)  # row of each canonical id, -1 if unreachable
+        self.index[ids] = np.arange(len(ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def build():
+        """
+        Enumerate every reachable position once (up to symmetry), one ply at a time
+        """
+        levels = [np.array([0])]  # empty board
+        afterstates = []
+        for i in range(9):
+            player = (i % 2) + 1
+            states = levels[i]
+            playable = (DIGITS[states] == 0) & (STATUS[states] == GameStatus.RUNNING)[:, None]
+            children = np.where(playable, CANON_ID[np.where(playable, states[:, None] + player * POW3, 0)], -1)
+            afterstates.append(children)
+            levels.append(np.unique(children[playable]))
+        afterstates.append(np.full((len(levels[9]), 9), -1))  # board is full after 9 moves
+        return StateSpace(np.concatenate(levels), np.concatenate(afterstates))
+
+    def save(self, rpath):
+        np.savez(rpath, ids=self.ids, afterstates=self.afterstates)
+
+    @staticmethod
+    def load(rpath):
+        with np.load(rpath) as data:
+            return StateSpace(data["ids"], data["afterstates"])
+
+    def levels(self):
+        """
+        :return: list of row indices for each ply, levels()[i] holding the positions with i moves played
+        """
+        return [np.flatnonzero(self.ply == i) for i in range(10)]
+
+    def move_afterstates(self, code):
+        """
+        Afterstates of every move on a board, in that board's own orientation
+        :param code: encoding of the board (Board.code), not necessarily canonical
+        :return: length 9 array. entry j is the canonical id of the afterstate of playing on square j+1, or -1 if
+                 square j+1 isn't a legal move
+        """
+        row = self.index[CANON_ID[code]]
+        if row == -1:
+            raise ValueError(f"board {code} is not a reachable position")
+        return self.afterstates[row, INV_SYMMETRIES[CANON_SYM[code]]]
+
+
+_state_space = None
+
+
+def get_state_space(cache_dir=CACHE_DIR):
+    """
+    The shared StateSpace, loaded from cache_dir if it has been built before
+    """
+    global _state_space
+    if _state_space is None:
+        rpath = os.path.join(cache_dir, "state_space.npz")
+        if os.path.exists(rpath):
+            _state_space = StateSpace.load(rpath)
+        else:
+            _state_space = StateSpace.build()
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = rpath.removesuffix(".npz") + f".{os.getpid()}.tmp.npz"
+            _state_space.save(tmp_path)
+            os.replace(tmp_path, rpath)
+    return _state_space
@@ -0,0 +1,224 @@
+"""
+Hyperparameter sweeps: train agents with many settings at once, one process per run, and tabulate how well they play.
+
+    python Sweep.py sweep.jsonl --alpha 0.01 0.1 --epsilon 0.01 0.1 --agent TDAgent MCAgent --games 50000 --seeds 3
+    python Sweep.py sweep.jsonl --random 20 --alpha 0.001 0.3 --epsilon 0.001 0.3 --gamma 0.8 1.0
+    python Sweep.py sweep.jsonl --table
+
+Each finished run is appended to the results file straight away, so a sweep which gets interrupted picks up where it
+left off when it's run again with the same results file.
+"""
+from Agent import EpsilonAgent, TDAgent, MCAgent
+from CheckpointWriter import RunState
+from Convergence import ConvergenceTracker
+from StateSpace import get_state_space
+from RandomStream import RandomStream
+from ValueStore import ArrayValue
+import DPSolver
+import Evaluator
+import main
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import numpy as np
+import os
+import shutil
+import time
+
+AGENTS = {"TDAgent": TDAgent, "MCAgent": MCAgent}
+PARAMS = ("agent", "alpha", "gamma", "epsilon", "games")  # settings of a run, apart from the seed
+
+
+def run_name(config):
+    return (f"{config['agent']}_a{config['alpha']:g}_g{config['gamma']:g}_e{config['epsilon']:g}"
+            f"_n{config['games']}_s{config['seed']}")
+
+
+def grid(agent=("TDAgent",), alpha=(0.01,), gamma=(0.9,), epsilon=(0.01,), games=(500_000,), seeds=1):
+    """
+    :return: list of configs for every combination of the settings, each run with seeds 0 to seeds-1
+    """
+    return [
+        {"agent": a, "alpha": al, "gamma": g, "epsilon": e, "games": n, "seed": seed}
+        for a, al, g, e, n, seed in itertools.product(agent, alpha, gamma, epsilon, games, range(seeds))
+    ]
+
+
+def random_search(n, agent=("TDAgent",), alpha=(0.001, 0.3), gamma=(0.8, 1.0), epsilon=(0.001, 0.3),
+                  games=(500_000,), seeds=1, rng=None):
+    """
+    :param n: number of settings to try
+    :param alpha: (low, high). sampled log-uniformly
+    :param gamma: (low, high). sampled uniformly
+    :param epsilon: (low, high). sampled log-uniformly
+    :param agent: agent classes to choose from
+    :param games: game budgets to choose from
+    :return: list of configs for n random settings, each run with seeds 0 to seeds-1
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+
+    def log_uniform(low, high):
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+
+    configs = []
+    for _ in range(n):
+        setting = {
+            "agent": str(rng.choice(agent)),
+            "alpha": round(log_uniform(*alpha), 5),
+            "gamma": round(float(rng.uniform(*gamma)), 4),
+            "epsilon": round(log_uniform(*epsilon), 5),
+            "games": int(rng.choice(games)),
+        }
+        configs += [dict(setting, seed=seed) for seed in range(seeds)]
+    return configs
+
+
+def run(config, out_dir, stop_agreement=None):
+    """
+    Train a pair of agents with one config and measure how well they play
+    :param config: dict of agent, alpha, gamma, epsilon, games, seed
+    :param out_dir: directory for each run's value fns and logs
+    :param stop_agreement: stop training early once greedy moves are optimal this often. None to use the full budget
+    :return: dict of the config and its results
+    """
+    run_dir = os.path.join(out_dir, run_name(config))
+    checkpoint_path = os.path.join(run_dir, "checkpoint.pkl")
+    start = time.perf_counter()
+    if os.path.exists(checkpoint_path):
+        # an earlier sweep was interrupted during this run. carry it on, so its logs stay one run
+        state = RunState.load(checkpoint_path)
+        p1, p2 = state["args"]["p1"], state["args"]["p2"]
+        games_played = main.resume_training(checkpoint_path, state)
+    else:
+        # start from an empty directory, so logs of a run interrupted before its first checkpoint aren't appended to
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir)
+        agent = AGENTS[config["agent"]]
+        p1_rng, p2_rng = RandomStream(config["seed"]).spawn(2)  # the seed fixes every random choice of the run
+        p1 = agent(1, value=ArrayValue(), rng=p1_rng)
+        p2 = agent(2, value=ArrayValue(), rng=p2_rng)
+        games_played = main.__train_agents(
+            p1, p2, os.path.join(run_dir, "x.ttv"), os.path.join(run_dir, "o.ttv"),
+            metrics_path=os.path.join(run_dir, "metrics.jsonl"), log_path=os.path.join(run_dir, "metrics.log"),
+            checkpoint_path=checkpoint_path,
+            stop_agreement=stop_agreement, epsilon=config["epsilon"], gamma=config["gamma"], alpha=config["alpha"],
+            n_games=config["games"], verbose=False,
+        )
+    seconds = time.perf_counter() - start  # only counts this session's training when a run was carried on
+
+    # evaluate the greedy policies
+    optimal = DPSolver.optimal_value_fn(config["gamma"])
+    x = EpsilonAgent(1, epsilon=0, gamma=config["gamma"], value=p1.value, rng=p1.rng)
+    o = EpsilonAgent(2, epsilon=0, gamma=config["gamma"], value=p2.value, rng=p2.rng)
+    x_rmse, x_agreement, _ = ConvergenceTracker(x, optimal).update()
+    o_rmse, o_agreement, _ = ConvergenceTracker(o, optimal).update()
+    return dict(
+        config,
+        games_played=games_played,
+        seconds=seconds,
+        x_vs_optimal=Evaluator.evaluate(x, Evaluator.optimal_agent(2, optimal), optimal)["Any"],
+        o_vs_optimal=Evaluator.evaluate(o, Evaluator.optimal_agent(1, optimal), optimal)["Any"],
+        x_vs_random=Evaluator.evaluate(x, Evaluator.random_agent(2), optimal)["Any"],
+        o_vs_random=Evaluator.evaluate(o, Evaluator.random_agent(1), optimal)["Any"],
+        rmse=[x_rmse, o_rmse],
+        agreement=[x_agreement, o_agreement],
+    )
+
+
+def _run(args):
+    return run(*args)
+
+
+def load_results(rpath):
+    """
+    :return: list of result dicts in a results file (empty if it doesn't exist yet)
+    """
+    if not os.path.exists(rpath):
+        return []
+    with open(rpath) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sweep(configs, results_path, out_dir="sweep_runs", workers=None, stop_agreement=None):
+    """
+    Run every config that isn't already in the results file, in a pool of worker processes
+    :param configs: list of configs, e.g. from grid() or random_search()
+    :param results_path: JSON lines file that results are appended to
+    :param out_dir: directory for each run's value fns and logs
+    :param workers: number of processes. defaults to every core
+    :param stop_agreement: passed on to run()
+    :return: list of results for every config, including ones from earlier sweeps
+    """
+    done = {run_name(result): result for result in load_results(results_path)}
+    todo = [config for config in configs if run_name(config) not in done]
+    print(f"{len(configs) - len(todo)} of {len(configs)} runs already done, {len(todo)} to go")
+
+    # build the shared caches once, so the workers don't all race to write them
+    get_state_space()
+    for gamma in {config["gamma"] for config in todo}:
+        DPSolver.optimal_value_fn(gamma)
+
+    if todo:
+        with mp.Pool(workers or os.cpu_count()) as pool, open(results_path, "a") as f:
+            for result in pool.imap_unordered(_run, [(config, out_dir, stop_agreement) for config in todo]):
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                done[run_name(result)] = result
+                print(f"finished {run_name(result)} ({len(done)} done)")
+    return [done[run_name(config)] for config in configs if run_name(config) in done]
+
+
+def results_table(results):
+    """
+    :param results: list of result dicts
+    :return: table of the results as a string, averaged over seeds and best settings first
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(tuple(result[k] for k in PARAMS), []).append(result)
+
+    rows = []
+    for setting, runs in groups.items():
+        mean = lambda key: np.mean([r[key] for r in runs], axis=0)
+        x_opt, o_opt = mean("x_vs_optimal"), mean("o_vs_optimal")
+        x_rand, o_rand = mean("x_vs_random"), mean("o_vs_random")
+        rows.append((x_opt[2] + o_opt[2], setting, len(runs), mean("games_played"), x_opt, o_opt, x_rand, o_rand,
+                     mean("rmse"), mean("agreement")))
+    rows.sort(key=lambda row: (row[0], row[8].mean()))
+
+    wdl = lambda r: f"{r[0]:.2f}/{r[1]:.2f}/{r[2]:.2f}"
+    lines = [f"{'agent':8s} {'alpha':>7s} {'gamma':>6s} {'eps':>7s} {'games':>7s} {'seeds':>5s} {'played':>7s} "
+             f"{'X v opt':>14s} {'O v opt':>14s} {'X v rand':>14s} {'O v rand':>14s} {'RMSE X/O':>11s} {'opt moves':>11s}"]
+    for _, (agent, alpha, gamma, epsilon, games), n, played, x_opt, o_opt, x_rand, o_rand, rmse, agreement in rows:
+        lines.append(f"{agent:8s} {alpha:7g} {gamma:6g} {epsilon:7g} {games:7d} {n:5d} {played:7.0f} "
+                     f"{wdl(x_opt):>14s} {wdl(o_opt):>14s} {wdl(x_rand):>14s} {wdl(o_rand):>14s} "
+                     f"{rmse[0]:5.3f}/{rmse[1]:5.3f} {agreement[0]:5.1%}/{agreement[1]:5.1%}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train agents over a grid (or random sample) of settings in parallel")
+    parser.add_argument("results", help="JSON lines file of results. runs already in it are skipped")
+    parser.add_argument("--agent", nargs="+", default=["TDAgent"], choices=sorted(AGENTS))
+    parser.add_argument("--alpha", nargs="+", type=float, default=[0.01], help="values, or low high with --random")
+    parser.add_argument("--gamma", nargs="+", type=float, default=[0.9], help="values, or low high with --random")
+    parser.add_argument("--epsilon", nargs="+", type=float, default=[0.01], help="values, or low high with --random")
+    parser.add_argument("--games", nargs="+", type=int, default=[500_000], help="game budgets")
+    parser.add_argument("--seeds", type=int, default=1, help="runs of each setting, with seeds 0, 1, ...")
+    parser.add_argument("--random", type=int, metavar="N", help="try N random settings instead of the grid")
+    parser.add_argument("--workers", type=int, help="number of processes (default: every core)")
+    parser.add_argument("--out-dir", default="sweep_runs", help="where each run's value fns and logs go")
+    parser.add_argument("--stop-agreement", type=float, help="stop runs early once greedy moves are this optimal")
+    parser.add_argument("--table", action="store_true", help="just print the table of results so far")
+    args = parser.parse_args()
+
+    if args.table:
+        print(results_table(load_results(args.results)))
+    else:
+        if args.random is not None:
+            configs = random_search(args.random, args.agent, args.alpha, args.gamma, args.epsilon, args.games, args.seeds)
+        else:
+            configs = grid(args.agent, args.alpha, args.gamma, args.epsilon, args.games, args.seeds)
+        results = sweep(configs, args.results, args.out_dir, args.workers, args.stop_agreement)
+        print(results_table(results))
@@ -26,15 +26,132 @@ def coords_to_idx(row, col):
     return 1 + (3 * (2 - row)) + col
 
 
+# Boards are stored as two 9-bit ints, one per player.
+# bit (pos-1) is set if the player holds square pos, so bit 0 is the bottom-left square.
+_FULL = (1 << 9) - 1
+
+# every line of three as a bitmask
+LINES = tuple(sum(1 << (pos - 1) for pos in line) for line in [
+    (1, 2, 3), (4, 5, 6), (7, 8, 9),  # rows
+    (1, 4, 7), (2, 5, 8), (3, 6, 9),  # cols
+    (1, 5, 9), (3, 5, 7),  # diagonals
+])
+
+# lines through each square. a move can only complete one of these
+_LINES_THROUGH = tuple(tuple(line for line in LINES if line & (1 << i)) for i in range(9))
+
+# legal moves (1-9) for every mask of free squares, so get_legals is a single lookup
+_LEGALS = tuple(tuple(i + 1 for i in range(9) if free & (1 << i)) for free in range(1 << 9))
+
+_POPCOUNT = tuple(bin(mask).count("1") for mask in range(1 << 9))
+
+
+def _symmetry_perms():
+    """
+    The 8 symmetries of the square as permutations of bit indices, in the same order as Board.equivs().
+    perm[i] is the square which gets moved onto square i.
+    """
+    grid = np.array([[coords_to_idx(row, col) - 1 for col in range(3)] for row in range(3)])
+    transforms = [
+        grid, np.rot90(grid), np.rot90(grid, 2), np.rot90(grid, 3),
+        np.flipud(grid), np.fliplr(grid), grid.T, grid[::-1, ::-1].T
+    ]
+    perms = []
+    for t in transforms:
+        perm = [0] * 9
+        for dest, src in zip(grid.flat, t.flat):
+            perm[dest] = int(src)
+        perms.append(tuple(perm))
+    return perms
+
+
+SYMMETRIES = _symmetry_perms()
+
+# Every position also has a base 3 encoding, where square pos contributes (0=free, 1=X, 2=O) * 3**(pos-1).
+# This indexes the lookup tables below, which cover all 3^9 encodings (reachable or not).
+N_CODES = 3 ** 9
+POW3 = 3 ** np.arange(9)
+
+# DIGITS[code] is the "flat" board of an encoding, where index 0 is position 1
+DIGITS = ((np.arange(N_CODES)[:, None] // POW3) % 3).astype(np.int8)
+
+
+def _canonical_tables():
+    """
+    Encode every transformation of every board, and keep the minimal one
+    :return: (canonical encoding, index into SYMMETRIES of the transform which produced it), for each encoding
+    """
+    transformed = np.stack([DIGITS[:, perm] @ POW3 for perm in SYMMETRIES])
+    return transformed.min(axis=0), transformed.argmin(axis=0).astype(np.int8)
+
+
+CANON_ID, CANON_SYM = _canonical_tables()
+
+# python copies of the tables, since indexing a list is much faster than indexing an ndarray one element at a time
+_CANON = CANON_ID.tolist()
+_TERN = tuple(sum(3 ** i for i in range(9) if mask & (1 << i)) for mask in range(1 << 9))
+_CODE_X = ((DIGITS == 1) @ (1 << np.arange(9))).tolist()
+_CODE_O = ((DIGITS == 2) @ (1 << np.arange(9))).tolist()
+
+
+def _status_table():
+    """
+    GameStatus of every encoding, computed for all boards at once.
+    (boards where both players have a line can't come up in a game, and are marked as P1_WIN)
+    """
+    lines = np.array(LINES)
+    x = np.array(_CODE_X)[:, None]
+    o = np.array(_CODE_O)[:, None]
+    status = np.full(N_CODES, GameStatus.RUNNING, dtype=np.int8)
+    status[(x | o)[:, 0] == _FULL] = GameStatus.DRAW
+    status[((o & lines) == lines).any(axis=1)] = GameStatus.P2_WIN
+    status[((x & lines) == lines).any(axis=1)] = GameStatus.P1_WIN
+    return status
+
+
+STATUS = _status_table()
+
+
 class Board:
     """
     Smart game board for TicTacToe
     """
-    def __init__(self, board=np.zeros([3,3], dtype=int)):
+    __slots__ = ("x", "o")
+
+    def __init__(self, board=None):
         """
-        :param board: 3x3 numpy array, where 0=free, 1=X, 2=O
+        :param board: optional 3x3 numpy array, where 0=free, 1=X, 2=O
         """
-        self.board = board.copy()  # 0=free. 1=player1=X. 2=player2=O
+        self.x = 0  # squares held by player1=X
+        self.o = 0  # squares held by player2=O
+        if board is not None:
+            for i, cell in enumerate(np.flipud(board).reshape(9)):
+                if cell == 1:
+                    self.x |= 1 << i
+                elif cell == 2:
+                    self.o |= 1 << i
+
+    @staticmethod
+    def from_bits(x, o):
+        """
+        Build a board straight from its bitboards, skipping the numpy conversion
+        :param x: 9-bit int of squares held by X
+        :param o: 9-bit int of squares held by O
+        :return: Board
+        """
+        board = Board.__new__(Board)
+        board.x = x
+        board.o = o
+        return board
+
+    @staticmethod
+    def from_code(code):
+        """
+        Recover the game board from its base 3 encoding. Board.from_code(board.code) should do nothing
+        :param code: int in range(3**9)
+        :return: Board with that encoding
+        """
+        return Board.from_bits(_CODE_X[code], _CODE_O[code])
 
     @staticmethod
     def from_string(init_string):
@@ -43,14 +160,18 @@ class Board:
         :param init_string:
         :return: Board specified by the string
         """
-        arr = np.zeros((3,3), dtype=int)
+        x = o = 0
         lines = init_string.splitlines()
         lines_no_dash = [lines[0], lines[2], lines[4]]  # remove lines that are ---------
-        for j, line in enumerate(lines_no_dash):
-            XO_inv = lambda c: 0 if c==" " else 1 if c=="X" else 2
-            arr[j] = [XO_inv(line[k]) for k in [0, 4, 8]]
+        for row, line in enumerate(lines_no_dash):
+            for col, k in enumerate([0, 4, 8]):
+                bit = 1 << (coords_to_idx(row, col) - 1)
+                if line[k] == "X":
+                    x |= bit
+                elif line[k] == "O":
+                    o |= bit
 
-        return Board(board=arr)
+        return Board.from_bits(x, o)
 
     @staticmethod
     def to_digits(board):
@@ -64,15 +185,29 @@ class Board:
     def play_move(self, pos, player):
         """
         player `player` played on square `pos`
+        only the lines through `pos` are checked for a win, since any other line was already checked
         :param pos: # from 1-9 with ordering same as numpad
         :param player: 1 for p1, 2 for p2
+        :return: GameStatus after the move
         """
         assert (pos in [1,2,3,4,5,6,7,8,9])
         assert (player in [1,2])
 
-        row, col = idx_to_coords(pos)
-        self.board[row][col] = player
-        return self.running_state()
+        i = int(pos) - 1
+        if player == 1:
+            self.x |= 1 << i
+            mine = self.x
+        else:
+            self.o |= 1 << i
+            mine = self.o
+
+        for line in _LINES_THROUGH[i]:
+            if mine & line == line:
+                return player
+
+        if self.x | self.o == _FULL:
+            return GameStatus.DRAW
+        return GameStatus.RUNNING
 
     def sim_move(self, pos, player):
         """
@@ -94,26 +229,17 @@ class Board:
         returns id of winning player (1 or 2) if someone has won
         returns RunningState.DRAW or RunningState.RUNNING if nobody has won
         """
-        # check rows/cols
-        for i in range(3):
-            row = self.board[i, :]
-            col = self.board[:, i]
-            for ax in [row, col]:
-                if ax[0] != 0 and np.all(ax == ax[0]):
-                    return ax[0]  # return ID of winning player
-
-        # check diagonals
-        d1 = self.board[[0, 1, 2], [0, 1, 2]]  # (0,0), (1,1), (2,2)
-        d2 = self.board[[0, 1, 2], [2, 1, 0]]  # (0,2), (1,1), (2,0)
-        for ax in [d1, d2]:
-            if ax[0] != 0 and np.all(ax == ax[0]):
-                return ax[0]  # return ID of winning player
+        x, o = self.x, self.o
+        for line in LINES:
+            if x & line == line:
+                return GameStatus.P1_WIN
+            if o & line == line:
+                return GameStatus.P2_WIN
 
         # check if board is full
-        if len(self.get_legals()) == 0:
+        if x | o == _FULL:
             return GameStatus.DRAW
 
-        # no winner. return 0
         return GameStatus.RUNNING
 
     def equivs(self):
@@ -125,32 +251,41 @@ class Board:
         r1 = np.rot90(r0)
         r2 = np.rot90(r1)
         r3 = np.rot90(r2)
-        href = np.fliplr(self.board)
-        vref = np.flipud(self.board)
-        diag = self.board.T
-        diag2 = self.board[::-1,::-1].T
+        href = np.fliplr(r0)
+        vref = np.flipud(r0)
+        diag = r0.T
+        diag2 = r0[::-1,::-1].T
         return [r0, r1, r2, r3, vref, href, diag, diag2]
 
     def get_legals(self):
         """
-        :return: list of positions (1,2,3..9) indicating legal moves
+        :return: tuple of positions (1,2,3..9) indicating legal moves
         """
-
-        return np.nonzero(self.get_flat() == 0)[0] + 1
+        return _LEGALS[_FULL & ~(self.x | self.o)]
 
     def get_flat(self):
         """
         :return: returns a "flat" representation of the board, where index 0 is position 1
         and index 8 is position 9
         """
-        return (np.flipud(self.board)).reshape(9)
+        x, o = self.x, self.o
+        return np.array([1 if x >> i & 1 else 2 if o >> i & 1 else 0 for i in range(9)])
+
+    @property
+    def board(self):
+        """
+        3x3 numpy array, where 0=free, 1=X, 2=O. built on demand from the bitboards
+        """
+        return np.flipud(self.get_flat().reshape(3, 3))
 
     def copy(self):
-        return Board(self.board)
+        return Board.from_bits(self.x, self.o)
 
     def __repr__(self):
         XO = [" ", "X", "O"]
-        a = [XO[x] for x in np.nditer(self.board)]
+        x, o = self.x, self.o
+        # rows are printed top to bottom, i.e. squares 7-9 first
+        a = [XO[1 if x >> i & 1 else 2 if o >> i & 1 else 0] for i in (6, 7, 8, 3, 4, 5, 0, 1, 2)]
         s = (
             f"{a[0]} | {a[1]} | {a[2]}\n"
             f"{'-'*9}\n"
@@ -160,14 +295,27 @@ class Board:
         )
         return s
 
+    @property
+    def code(self):
+        """
+        base 3 encoding of the board
+        """
+        return _TERN[self.x] + 2 * _TERN[self.o]
+
+    def canonical_id(self):
+        """
+        :return: encoding of the "minimal" transformation of the board. Equal for all equivalent boards
+        """
+        return _CANON[_TERN[self.x] + 2 * _TERN[self.o]]
+
     def __hash__(self):
         """
         hash all the equivalent boards, then take the "minimum" hash.
         transformations are rotation and reflection (group of symmetries of a square)
+        the minimum over the transformations is precomputed, so this is a single table lookup
         :return: hashed "minimal" transformation
         """
-
-        return hash(min([self.to_digits(b) for b in self.equivs()]))
+        return _CANON[_TERN[self.x] + 2 * _TERN[self.o]]
 
     def __eq__(self, other):
         """
@@ -175,11 +323,9 @@ class Board:
         :param other: Board to compare against
         :return: true if other.board is a transformation of self.board
         """
-        for a in self.equivs():
-            if self.to_digits(a) == self.to_digits(other.board):
-                return True
-        return False
+        if not isinstance(other, Board):
+            return NotImplemented
+        return _CANON[_TERN[self.x] + 2 * _TERN[self.o]] == _CANON[_TERN[other.x] + 2 * _TERN[other.o]]
 
     def __len__(self):
-        return np.count_nonzero(self.board)
-
+        return _POPCOUNT[self.x | self.o]
@@ -0,0 +1,121 @@
+"""
+Binary file format for value functions.
+
+Layout (little endian):
+    header (32 bytes): magic b"TTTVALUE", format version (uint32), value dtype (4 byte numpy dtype str, e.g. "<f8"),
+                       number of states n (uint64), padding
+    ids: n int32 canonical board ids (Board.canonical_id()), padded to a multiple of 8 bytes
+    values: n floats of the header's dtype
+
+Both arrays are read with np.memmap, so loading never parses anything.
+Run this file to convert .json value functions: python ValueFile.py DPValue.json TDValueX.json ...
+"""
+from TicTacToe import Board
+from ValueStore import ArrayValue
+import numpy as np
+import json
+import struct
+import sys
+
+EXTENSION = ".ttv"
+MAGIC = b"TTTVALUE"
+VERSION = 1
+_HEADER = struct.Struct("<8sI4sQ8x")
+
+
+def _layout(n):
+    """
+    :return: byte offsets of the ids and values for a file holding n states
+    """
+    ids_offset = _HEADER.size
+    values_offset = ids_offset + -(-4 * n // 8) * 8
+    return ids_offset, values_offset
+
+
+def save(rpath, value, dtype=np.float64):
+    """
+    Write a value function to rpath
+    :param rpath: path to the file
+    :param value: ArrayValue or {Board: float} dict
+    :param dtype: np.float32 or np.float64
+    """
+    if isinstance(value, ArrayValue):
+        ids = value.ids()
+        values = value.table[ids]
+    else:
+        ids = [board.canonical_id() for board in value]
+        values = list(value.values())
+    ids = np.asarray(ids, dtype="<i4")
+    values = np.asarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+
+    ids_offset, values_offset = _layout(len(ids))
+    with open(rpath, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, values.dtype.str.encode(), len(ids)))
+        f.write(ids.tobytes())
+        f.write(b"\0" * (values_offset - ids_offset - ids.nbytes))
+        f.write(values.tobytes())
+
+
+def load(rpath):
+    """
+    Memory-map a value function file
+    :param rpath: path to the file
+    :return: (ids, values) read-only arrays
+    """
+    with open(rpath, "rb") as f:
+        magic, version, dtype, n = _HEADER.unpack(f.read(_HEADER.size))
+    dtype = dtype.rstrip(b"\0").decode()
+    if magic != MAGIC:
+        raise ValueError(f"{rpath} is not a value function file")
+    if version != VERSION:
+        raise ValueError(f"{rpath} has format version {version}, expected {VERSION}")
+    if n == 0:
+        return np.zeros(0, dtype="<i4"), np.zeros(0, dtype=dtype)
+
+    ids_offset, values_offset = _layout(n)
+    ids = np.memmap(rpath, dtype="<i4", mode="r", offset=ids_offset, shape=(n,))
+    values = np.memmap(rpath, dtype=dtype, mode="r", offset=values_offset, shape=(n,))
+    return ids, values
+
+
+def load_value(rpath, value=None):
+    """
+    Read a value function file into a value store
+    :param rpath: path to the file
+    :param value: ArrayValue or dict to fill. A new ArrayValue is made if not given
+    :return: the filled value store
+    """
+    value = ArrayValue() if value is None else value
+    ids, values = load(rpath)
+    if isinstance(value, ArrayValue):
+        value.table[ids] = values
+        value.seen[ids] = True
+    else:
+        for i, v in zip(ids.tolist(), values.tolist()):
+            value[Board.from_code(i)] = v
+    return value
+
+
+def convert(json_path, out_path=None, dtype=np.float64):
+    """
+    Convert a .json value function (as written by Agent.save_value) to the binary format
+    :param json_path: path to the .json file
+    :param out_path: where to write. defaults to json_path with the .json swapped for EXTENSION
+    :param dtype: np.float32 or np.float64
+    :return: out_path
+    """
+    if out_path is None:
+        out_path = json_path.removesuffix(".json") + EXTENSION
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    value = ArrayValue()
+    for k, v in data.items():
+        value[Board.from_string(k)] = v
+    save(out_path, value, dtype=dtype)
+    return out_path
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(f"{path} -> {convert(path)}")
@@ -0,0 +1,104 @@
+"""
+Array-backed storage for value functions.
+"""
+from collections.abc import MutableMapping
+from TicTacToe import Board, N_CODES
+from StateSpace import get_state_space
+import numpy as np
+
+
+class ArrayValue(MutableMapping):
+    """
+    Value function stored in a preallocated array, indexed by canonical board id.
+    Acts like the {Board: float} dict the agents keep in self.value, so it can be dropped in as a replacement.
+    Keys can be Boards or canonical ids (Board.canonical_id()).
+    """
+
+    def __init__(self, dtype=np.float64):
+        """
+        :param dtype: float type of the stored values
+        """
+        self.table = np.zeros(N_CODES, dtype=dtype)  # value of each state, indexed by canonical id
+        self.seen = np.zeros(N_CODES, dtype=bool)  # True for states which have been given a value
+
+    @staticmethod
+    def _id(key):
+        return key.canonical_id() if isinstance(key, Board) else key
+
+    def ids(self):
+        """
+        :return: array of the canonical ids of every state with a value
+        """
+        return np.flatnonzero(self.seen)
+
+    def move_values(self, board, init):
+        """
+        Look up the value of every legal move's afterstate at once, using the StateSpace graph
+        :param board: Board to move on
+        :param init: called as init(n) for the initial values of n afterstates seen for the first time.
+                     symmetric moves lead to the same afterstate, which is only initialized once
+        :return: (array of legal moves (1-9), array of their afterstate values)
+        """
+        afterstates = get_state_space().move_afterstates(board.code)
+        legal = afterstates >= 0
+        ids = afterstates[legal]
+
+        # add states to value fn on first visit, in move order like a dict does
+        new = ids[~self.seen[ids]]
+        if len(new):
+            _, first = np.unique(new, return_index=True)
+            new = new[np.sort(first)]
+            self.table[new] = init(len(new))
+            self.seen[new] = True
+
+        return np.flatnonzero(legal) + 1, self.table[ids]
+
+    def copy(self):
+        other = ArrayValue(dtype=self.table.dtype)
+        other.table[:] = self.table
+        other.seen[:] = self.seen
+        return other
+
+    def clear(self):
+        self.table[:] = 0
+        self.seen[:] = False
+
+    def __getitem__(self, key):
+        i = self._id(key)
+        if not self.seen[i]:
+            raise KeyError(key)
+        return float(self.table[i])
+
+    def __setitem__(self, key, value):
+        i = self._id(key)
+        self.table[i] = value
+        self.seen[i] = True
+
+    def __delitem__(self, key):
+        i = self._id(key)
+        if not self.seen[i]:
+            raise KeyError(key)
+        self.seen[i] = False
+        self.table[i] = 0
+
+    def __contains__(self, key):
+        return bool(self.seen[self._id(key)])
+
+    def __iter__(self):
+        # yields the canonical board of each state
+        return (Board.from_code(i) for i in self.ids().tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.seen))
+
+    def __or__(self, other):
+        """
+        merge two value functions, like dict | dict. values from other take priority
+        """
+        merged = self.copy()
+        if isinstance(other, ArrayValue):
+            merged.table[other.seen] = other.table[other.seen]
+            merged.seen |= other.seen
+        else:
+            merged.update(other)
+        return merged
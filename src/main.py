@@ -1,8 +1,13 @@
 from TicTacToe import Board, GameStatus
 from Agent import *
-import json
-from Plotter import Plotter
-import numpy as np
+from MetricsLog import MetricsWriter
+import MetricsLog
+from ValueStore import ArrayValue
+from ActorLearner import train_parallel
+from CheckpointWriter import CheckpointWriter, RunState
+from Instrumentation import TrainingMonitor
+from Convergence import EarlyStopping
+import argparse
 
 
 def human_v_human():
@@ -36,90 +41,194 @@ def human_v_human():
     print("If player 4 won that means a draw and you both suck")
 
 
-def __train_agents(p1, p2, p1_value_path, p2_value_path):
+REWARDS = {
+    GameStatus.DRAW: 0,
+    GameStatus.P1_WIN: 1,
+    GameStatus.P2_WIN: -1
+}
+
+
+def __train_agents(p1, p2, p1_value_path, p2_value_path, metrics_path="metrics.jsonl", profile_games=0,
+                   log_path="metrics.log", stop_rmse=None, stop_agreement=0.99, stop_window=10, stop_coverage=0.9,
+                   check_every=1000, epsilon=0.01, gamma=0.90, alpha=0.01, n_games=500_000, verbose=True,
+                   checkpoint_path="checkpoint.pkl", resume=None):
     """
-    train two agents by playing 500,000 matches
+    train two agents by playing up to n_games matches (500,000 by default)
+    every check_every games the value fns are compared to the optimal one, and training stops early once they're close
+    enough
     p1 and p2 could theoretically be different agent types, though I haven't tested it yet
     :param p1: Agent playing X
     :param p2: Agent playing Y
-    :param p1_value_path: where to save value fn of p1
-    :param p2_value_path: where to save value fn of p2
-    :return:
+    :param p1_value_path: where to save value fn of p1. n-tuple networks go to the same path with a .npz suffix
+    :param p2_value_path: where to save value fn of p2. n-tuple networks go to the same path with a .npz suffix
+    :param metrics_path: where to append timing/throughput stats (JSON lines, every check_every games)
+    :param profile_games: run cProfile over the first this many games. 0 for no profiling
+    :param log_path: where to log game outcomes and opener values. plot them with `python Plotter.py metrics.log`
+    :param stop_rmse: stop once both value fns have at most this RMSE against the optimal values. None to ignore
+    :param stop_agreement: stop once both agents' greedy moves are optimal at least this often. None to ignore
+    :param stop_window: number of checks in a row (check_every games apart) the stopping thresholds have to hold for
+    :param stop_coverage: stop only once both agents have a value for every move in at least this fraction of the
+                          positions they play in, so agreement isn't judged on a handful of positions. None to ignore
+    :param check_every: number of games between convergence checks, checkpoints and progress reports
+    :param epsilon: % chance of a random move
+    :param gamma: decay rate for rewards
+    :param alpha: learning rate
+    :param n_games: most games to play
+    :param verbose: print progress every check_every games
+    :param checkpoint_path: where to save the full state of the run every check_every games, for resume_training()
+    :param resume: state loaded from a checkpoint, to carry on that run. use resume_training() rather than passing it
+    :return: number of games played
     """
+    run_args = {name: value for name, value in locals().items() if name != "resume"}  # saved in checkpoints
+    if resume is not None and resume["stopped"]:
+        print(f"this run already converged after {resume['games_played']} games")
+        return resume["games_played"]
 
     # learning params
-    epsilon = 0.01  # % chance of a random move
-    gamma = 0.90  # decay rate for rewards
-    alpha = 0.01  # learning rate
-    games_played = 0
-
-    plotter = Plotter(p1, p2)
-
-    startermove = 1
-
-    plot = False  # only plot if we've seen all the start states (plotter code breaks otherwise)
-    while games_played < 500_000:
-
-        # start with each opener evenly
-        match startermove:
-            case 1:
-                startermove = 2
-            case 2:
-                startermove = 5
-            case 5:
-                startermove = 1
-                plot = True  # all start states seen - now safe to plot
-        # play match
-        outcome, game_log = play_match(p1, p2, epsilon, startermove)
-        games_played += 1
-
-        # update value fns
-        # p1 trains on all its "afterstates", p2 on its "afterstates".
-        p1.train(game_log[::2], REWARDS[outcome], gamma=gamma, alpha=alpha)
-        p2.train(game_log[1::2], REWARDS[outcome], gamma=gamma, alpha=alpha)
-
-        # logging and plotting
-        if plot:
-            openers = {1: "Corner", 2: "Side", 5: "Centre"}
-            plotter.log_and_plot(outcome, opener=openers[startermove])
-
-        # save value fn
-        if games_played % 1000 == 0:
-            print(f"saving value functions... ({len(p1.value) + len(p2.value)} states seen, {games_played} games played)")
-            with open(p1_value_path, "w") as f:
-                d = {str(board): val for board, val in p1.value.items()}
-                json.dump(d, f)
-            with open(p2_value_path, "w") as f:
-                d = {str(board): val for board, val in p2.value.items()}
-                json.dump(d, f)
+    for agent in (p1, p2):
+        agent.epsilon, agent.gamma, agent.alpha = epsilon, gamma, alpha
+
+    if resume is not None:
+        MetricsLog.truncate(log_path, resume["metrics_records"])  # drop games logged after the checkpoint
+    metrics = MetricsWriter(log_path, p1)  # plotted by Plotter.py in its own process
+    writer = CheckpointWriter()  # saves value fns in the background
+    monitor = TrainingMonitor((p1, p2), metrics_path, every=check_every,
+                              profile_games=profile_games, profile_path="train.prof" if profile_games else None)
+
+    trajectory = Trajectory()  # reused for every game
+    openers = {1: "Corner", 2: "Side", 5: "Centre"}
+    if resume is None:
+        convergence = EarlyStopping((p1, p2), stop_rmse, stop_agreement, stop_window, min_coverage=stop_coverage)
+        games_played = 0
+        startermove = 1
+    else:
+        convergence = resume["convergence"]
+        games_played = resume["games_played"]
+        startermove = resume["startermove"]
+        monitor.restore(resume["monitor"])
+
+    try:
+        while games_played < n_games:
+
+            # start with each opener evenly
+            match startermove:
+                case 1:
+                    startermove = 2
+                case 2:
+                    startermove = 5
+                case 5:
+                    startermove = 1
+            # play match
+            with monitor.phase("play"):
+                outcome, game_log = play_match(p1, p2, startermove, trajectory=trajectory)
+            games_played += 1
+
+            # update value fns
+            # p1 trains on all its "afterstates", p2 on its "afterstates".
+            with monitor.phase("train"):
+                p1.train(game_log.afterstates(1), REWARDS[outcome])
+                p2.train(game_log.afterstates(2), REWARDS[outcome])
+
+            # log outcome for plotting
+            with monitor.phase("log"):
+                metrics.log(outcome, opener=openers[startermove])
+
+            monitor.game_done(len(game_log))
+            if games_played % check_every == 0:
+                # check convergence
+                with monitor.phase("convergence"):
+                    stop = convergence.check()
+
+                # save value fns, and everything else needed to resume the run from here.
+                # the agents' RandomStreams get saved as part of the agents, which the convergence check holds
+                with monitor.phase("save"):
+                    metrics.flush()
+                    run_state = RunState(
+                        args=run_args, games_played=games_played, startermove=startermove, stopped=stop,
+                        convergence=convergence, metrics_records=metrics.games, monitor=monitor.state(),
+                    )
+                    writer.save((p1_value_path, p1.value), (p2_value_path, p2.value), (checkpoint_path, run_state))
+
+                if verbose:
+                    stats = monitor.last_report
+                    sizes = stats["table_sizes"]
+                    seen = f"{sum(sizes)} states seen, " if None not in sizes else ""
+                    print(f"saving value functions... ({seen}"
+                          f"{games_played} games played, {stats['games_per_sec']:.0f} games/sec)")
+                    print("  " + ", ".join(
+                        f"{name}: RMSE {rmse:.3f}, optimal moves {agreement:.1%} "
+                        f"(over {n_valued}/{tracker.positions} positions)"
+                        for name, tracker, (rmse, agreement, n_valued)
+                        in zip("XO", convergence.trackers, convergence.last)
+                    ))
+                if stop:
+                    if verbose:
+                        print(f"converged after {games_played} games")
+                    break
+    finally:
+        # also runs on Ctrl-C: save where we got to, and wait for the writes to finish
+        writer.save((p1_value_path, p1.value), (p2_value_path, p2.value))
+        writer.close()
+        metrics.close()
+        monitor.report()
+        monitor.close()
+    return games_played
+
+
+def resume_training(checkpoint_path, state=None):
+    """
+    Carry on a run of __train_agents from its last checkpoint, exactly as if it had never stopped
+    :param checkpoint_path: checkpoint file the run was saving to
+    :param state: the checkpoint, if it's already been loaded with RunState.load(). the agents being trained are
+                  state["args"]["p1"] and state["args"]["p2"]
+    :return: number of games played, including the ones before the checkpoint
+    """
+    state = RunState.load(checkpoint_path) if state is None else state
+    if state["args"]["verbose"]:
+        print(f"resuming from {checkpoint_path} after {state['games_played']} games")
+    return __train_agents(**dict(state["args"], checkpoint_path=checkpoint_path), resume=state)
 
 
 def train_TD():
-    p1 = TDAgent(1)
-    p2 = TDAgent(2)
+    p1 = TDAgent(1, value=ArrayValue())
+    p2 = TDAgent(2, value=ArrayValue())
     __train_agents(p1, p2, "TDValueX.json", "TDValueO.json")
 
 
 def train_montecarlo():
-    p1 = MCAgent(1)
-    p2 = MCAgent(2)
+    p1 = MCAgent(1, value=ArrayValue())
+    p2 = MCAgent(2, value=ArrayValue())
     __train_agents(p1, p2, "MCValueX.json", "MCValueO.json")
 
 
-if __name__ == "__main__":
+def train_TD_parallel():
+    """
+    train TD(0) agents with one learner process and a pool of actor processes playing the games
+    """
+    p1 = TDAgent(1, value=ArrayValue())
+    p2 = TDAgent(2, value=ArrayValue())
+    stats = train_parallel(p1, p2, 500_000)
+    print(f"{stats['games_per_sec']:.0f} games/sec with {stats['actors']} actors "
+          f"({stats['games_per_sec_per_core']:.0f} games/sec per core)")
+    p1.save_value("TDValueX.json")
+    p2.save_value("TDValueO.json")
 
-    REWARDS = {
-        GameStatus.DRAW: 0,
-        GameStatus.P1_WIN: 1,
-        GameStatus.P2_WIN: -1
-    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play or train Tic Tac Toe agents")
+    parser.add_argument("--resume", metavar="CHECKPOINT", help="carry on a training run from its checkpoint file")
+    args = parser.parse_args()
+    if args.resume is not None:
+        resume_training(args.resume)
+        raise SystemExit
 
     print("Welcome to TicTacToe")
     print("Please select an option...")
     print("1: Play human vs human")
     print("2: Train a MonteCarlo agent")
     print("3: Train a TD(0) agent")
-    options = {1: human_v_human, 2: train_montecarlo, 3: train_TD}
+    print("4: Train a TD(0) agent with parallel actors")
+    options = {1: human_v_human, 2: train_montecarlo, 3: train_TD, 4: train_TD_parallel}
     str_in = input()
     success = False
     while success is False: